@@ -1,13 +1,30 @@
 import datetime
+import hashlib
+import io
 import json
 import os
+from array import array
 from datetime import date
 from secrets import token_urlsafe
-from typing import Optional
+from typing import Iterator, Optional
 from urllib.parse import urlencode
 
-import requests
-from flask import Flask, render_template, request, url_for, flash, redirect, session
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    current_app,
+    render_template,
+    request,
+    url_for,
+    flash,
+    redirect,
+    session,
+    Response,
+    get_flashed_messages,
+    stream_template,
+    stream_with_context,
+)
 from flask_login import (
     LoginManager,
     current_user,
@@ -15,30 +32,227 @@ from flask_login import (
     logout_user,
     login_required,
 )
-from sqlalchemy import select
-from werkzeug.exceptions import abort
+from jinja2.utils import htmlsafe_json_dumps
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import RequestEntityTooLarge, abort
 
+from assets import assets, build_assets
+from cache import SessionUser, user_cache
+from changes import (
+    CHANGES_PAGE_SIZE,
+    get_changes,
+    settings_revised,
+    tags_revised,
+)
+from compression import compression
 from config import get_secret, get_oauth2_providers
-from models import db, init_db, User, Entry, Tag
-
-app = Flask(__name__)
-app.config["SECRET_KEY"] = get_secret("FLASK_SECRET_KEY")
-app.config["OAUTH2_PROVIDERS"] = get_oauth2_providers()
-app.config["SQLALCHEMY_DATABASE_URI"] = get_secret("DATABASE_URL")
-if app.config["SQLALCHEMY_DATABASE_URI"][:11] == "postgres://":
-    app.config["SQLALCHEMY_DATABASE_URI"] = (
-        "postgresql://" + app.config["SQLALCHEMY_DATABASE_URI"][11:]
-    )
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+from deletion import delete_account, delete_tag_rows, pending_deletions, purge_user
+from grid import WeekGrid, generate_week_grid, grid_bounds, grid_start
+from jobs import (
+    enqueue,
+    get_job,
+    job_status,
+    recent_jobs,
+    run_jobs,
+    start_worker_thread,
+)
+from metrics import metrics, timed
+from migrations import upgrade_db
+from models import (
+    db,
+    entry_tag,
+    get_or_create_tags,
+    init_db,
+    upsert,
+    User,
+    Entry,
+    Tag,
+)
+from oauth import OAuthError, oauth_client
+from occupancy import (
+    build_bitmap,
+    count_filled,
+    filled_dates,
+    get_occupancy,
+    is_filled,
+    iter_runs,
+    rebuild_occupancy,
+    week_index,
+)
+from querycount import query_counter
+from replica import read_only, reading_replica, replica_router
+from rollup import ZOOMS, get_rollup
+from search import (
+    SEARCH_PAGE_SIZE,
+    indexed,
+    rebuild_search_index,
+    search_entries,
+)
+from stats import get_tag_stats, rebuild_tag_stats
+from transfer import (
+    EXPORT_FORMATS,
+    IMPORT_INLINE_MAX_BYTES,
+    IMPORT_MAX_BYTES,
+    export_csv,
+    export_ndjson,
+    import_entries,
+    parse_rows,
+)
+from validation import date_error
+from writes import entries_changed
+
+bp = Blueprint("main", __name__, cli_group=None)
 login_manager = LoginManager()
-login_manager.init_app(app)
-db.init_app(app)
-if os.getenv("INIT_DB") is not None:
-    init_db(app)
+
+# Most weeks one POST to /entry/batch may create or update
+BATCH_MAX_WEEKS = 1000
+# Entry ids of the grid are fetched this many rows at a time, so that the
+# rows are not all held at once next to the array they are packed into
+GRID_YIELD_PER = 1000
+
+
+def create_app(config: Optional[dict] = None) -> Flask:
+    # Only cheap work happens here, as Fly scales to zero and this is on the
+    # cold start path; OAuth providers and HTTP clients load on first sign in
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = get_secret("FLASK_SECRET_KEY")
+    app.config["OAUTH2_PROVIDERS"] = None
+    app.config["OAUTH2_STUB"] = os.getenv("OAUTH2_STUB")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri(get_secret("DATABASE_URL"))
+    app.config["SQLALCHEMY_REPLICA_URI"] = database_uri(
+        os.getenv("DATABASE_REPLICA_URL")
+    )
+    app.config["REPLICA_STICKY_SECONDS"] = os.getenv("REPLICA_STICKY_SECONDS", 10)
+    for name, default in (
+        ("DB_POOL_SIZE", 5),
+        ("DB_MAX_OVERFLOW", 10),
+        ("DB_POOL_TIMEOUT", 10),
+        ("DB_POOL_RECYCLE", 1800),
+        ("DB_STATEMENT_TIMEOUT_MS", None),
+    ):
+        app.config[name] = os.getenv(name, default)
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["CACHE_TYPE"] = os.getenv("CACHE_TYPE", "filesystem")
+    app.config["CACHE_DIR"] = os.getenv("CACHE_DIR")
+    app.config["SQL_QUERY_LIMIT"] = os.getenv("SQL_QUERY_LIMIT")
+    app.config["SLOW_REQUEST_MS"] = os.getenv("SLOW_REQUEST_MS")
+    app.config["SLOW_REQUEST_SAMPLE_RATE"] = os.getenv("SLOW_REQUEST_SAMPLE_RATE", 1.0)
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")
+    app.config["COMPRESS_MIN_SIZE"] = os.getenv("COMPRESS_MIN_SIZE", 500)
+    # Largest request body, an import file with room for the rest of the form
+    app.config["MAX_CONTENT_LENGTH"] = int(
+        os.getenv("MAX_CONTENT_LENGTH", IMPORT_MAX_BYTES + 64 * 1024)
+    )
+    app.config["PAGE_VERSION"] = page_version(app)
+    if config is not None:
+        app.config.update(config)
+    login_manager.init_app(app)
+    replica_router.init_app(app)  # Sets the engine options db.init_app() reads
+    db.init_app(app)
+    user_cache.init_app(app)
+    query_counter.init_app(app)
+    metrics.init_app(app)
+    oauth_client.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+    app.register_blueprint(bp)
+    if os.getenv("INIT_DB") is not None:
+        upgrade_db(app)
+        init_db(app)
+    return app
+
+
+def database_uri(url: Optional[str]) -> Optional[str]:
+    # SQLAlchemy only accepts the postgresql:// scheme that Fly does not use
+    if url is not None and url[:11] == "postgres://":
+        return "postgresql://" + url[11:]
+    return url
+
+
+def page_version(app: Flask) -> str:
+    # Part of the GET / ETag, so a deploy that changes the templates or the
+    # static files it links to is not answered with 304s for pages rendered
+    # before it
+    folders = [app.template_folder]
+    folders += [os.path.join(app.static_folder, d) for d in ("assets", "css", "js")]
+    return str(
+        max(
+            f.stat().st_mtime_ns
+            for folder in folders
+            for f in os.scandir(os.path.join(app.root_path, folder))
+        )
+    )
+
+
+def oauth2_providers() -> dict:
+    providers = current_app.config["OAUTH2_PROVIDERS"]
+    if providers is None:
+        providers = get_oauth2_providers()
+        stub = current_app.config["OAUTH2_STUB"]
+        if stub is not None:
+            from oauth_stub import start_stub_server, stub_provider
+
+            # A URL points at a stub already running, e.g. shared by workers
+            base_url = stub if stub.startswith("http") else start_stub_server()
+            providers["stub"] = stub_provider(base_url)
+        current_app.config["OAUTH2_PROVIDERS"] = providers
+    return providers
+
+
+@bp.cli.command("upgrade-db")
+def upgrade_db_command():
+    """Create or upgrade the database schema in place."""
+    upgrade_db(current_app)
 
 
-def get_by_id_helper(model: db.Model, id: str, check_user=True) -> db.Model:
-    result = db.session.execute(select(model).where(model.id == id)).fetchone()
+@bp.cli.command("build-assets")
+def build_assets_command():
+    """Fingerprint and precompress static files into static/dist."""
+    manifest = build_assets(current_app.static_folder)
+    print(f"Built {len(manifest)} static files")
+
+
+@bp.cli.command("run-jobs")
+@click.option("--once", is_flag=True, help="Exit once no job is due.")
+def run_jobs_command(once: bool):
+    """Run queued jobs, such as account deletions and large imports."""
+    n_jobs = run_jobs(once)
+    print(f"Ran {n_jobs} jobs")
+
+
+@bp.cli.command("purge-deleted-users")
+def purge_deleted_users_command():
+    """Finish deleting accounts whose deletion job failed."""
+    for user_id in pending_deletions():
+        purge_user(user_id)
+        print(f"Deleted user {user_id}")
+
+
+@bp.cli.command("rebuild-search-index")
+@click.option("--user-id", type=int, help="Only reindex this user's entries.")
+def rebuild_search_index_command(user_id: Optional[int]):
+    """Reindex entry notes and tag names for search."""
+    rebuild_search_index(db.session, user_id)
+    db.session.commit()
+    print("Rebuilt search index" + (f" for user {user_id}" if user_id else ""))
+
+
+@bp.cli.command("rebuild-tag-stats")
+@click.option("--user-id", type=int, help="Only rebuild this user's statistics.")
+def rebuild_tag_stats_command(user_id: Optional[int]):
+    """Recompute the tag statistics table from entries."""
+    rebuild_tag_stats(db.session, user_id)
+    db.session.commit()
+    print("Rebuilt tag statistics" + (f" for user {user_id}" if user_id else ""))
+
+
+def get_by_id_helper(
+    model: db.Model, id: str, check_user=True, options: tuple = ()
+) -> db.Model:
+    result = db.session.execute(
+        select(model).where(model.id == id).options(*options)
+    ).fetchone()
     if (
         result is None
         or len(result) == 0
@@ -50,7 +264,7 @@ def get_by_id_helper(model: db.Model, id: str, check_user=True) -> db.Model:
 
 
 def get_entry_by_id(id: str) -> Entry:
-    return get_by_id_helper(Entry, id)
+    return get_by_id_helper(Entry, id, options=(selectinload(Entry.tags),))
 
 
 def get_tag_by_id(id: str) -> Tag:
@@ -58,8 +272,42 @@ def get_tag_by_id(id: str) -> Tag:
 
 
 @login_manager.user_loader
-def get_user_by_id(id: str) -> User:
-    return get_by_id_helper(User, id, check_user=False)
+def get_user_by_id(id: str) -> SessionUser:
+    user = user_cache.get_user(int(id))
+    if user is None:  # Not cached, or stale since the user's last write
+        db_user = get_by_id_helper(User, id, check_user=False)
+        if db_user.deleted_at is not None:  # Signed out everywhere
+            return None
+        if reading_replica():
+            return SessionUser(db_user.id, db_user.birth, db_user.exp_years)
+        user = user_cache.set_user(db_user)
+    return user
+
+
+def get_user_tags() -> list[Tag]:
+    return (
+        db.session.execute(
+            select(Tag).where(Tag.user_id == current_user.id).order_by(Tag.created)
+        )
+        .scalars()
+        .all()
+    )
+
+
+def week_taken(start: date) -> bool:
+    # Whether another of the user's entries starts that week: a bit test,
+    # unless the week is before the grid and so not in the bitmap
+    i = week_index(grid_start(current_user.birth), start)
+    if i is not None:
+        return is_filled(get_occupancy(current_user.id), i)
+    return (
+        db.session.execute(
+            select(Entry.id).where(
+                (Entry.user_id == current_user.id) & (Entry.start == start)
+            )
+        ).first()
+        is not None
+    )
 
 
 def get_create_user_by_oauth_id(oauth_id: str) -> tuple[User, bool]:
@@ -83,163 +331,438 @@ def get_create_user_by_oauth_id(oauth_id: str) -> tuple[User, bool]:
 
 def generate_all_entries(
     db_entries: list[Entry], birth: date, exp_years: int
-) -> list[tuple[date, bool, Optional[Entry]]]:
-    db_entries_dict = {x.start: x for x in db_entries}
-    start = birth - datetime.timedelta(days=birth.weekday())
-    if (
-        start.month == 2 and start.day == 29
-    ):  # If leap day but end year is not leap year
-        try:
-            end = start.replace(year=start.year + exp_years)
-        except ValueError:
-            end = start.replace(year=start.year + exp_years, month=3, day=1)
-    else:
-        end = start.replace(year=start.year + exp_years)
-    all_entries = []
-    curr = start
-    while curr <= end:
-        is_past = curr < datetime.datetime.now().date()
-        entry = db_entries_dict[curr] if curr in db_entries_dict else None
-        all_entries.append(
-            (curr, is_past, entry)
-        )  # adds sqlite3.Row objects if entry exists
-        curr += datetime.timedelta(weeks=1)
-    return all_entries
-
-
-@app.route("/")
-def index() -> str:
+) -> WeekGrid:
+    return generate_week_grid(db_entries, birth, exp_years)
+
+
+def invalidate_user_cache(user_id: int):
+    user_cache.bump(user_id)
+
+
+def conditional_response(response: Response) -> Response:
+    # Strong ETag over the full body, which also covers any flashed messages
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+def current_zoom() -> str:
+    zoom = request.args.get("zoom", "week")
+    if zoom not in ZOOMS:
+        abort(404)
+    return zoom
+
+
+def current_grid_key(zoom: str = "week") -> str:
+    date_today = datetime.datetime.now().date()
+    key = user_cache.grid_key(
+        current_user.id, date_today - datetime.timedelta(days=date_today.weekday())
+    )
+    return key if zoom == "week" else f"{key}:rollup:{zoom}"
+
+
+def iter_zoom_payload(key: str, zoom: str) -> Iterator[str]:
+    if zoom == "week":
+        yield from iter_grid_payload(key)
+        return
+    payload = user_cache.get(key)
+    if payload is None:
+        with timed("grid"):
+            rollup = get_rollup(
+                current_user.id,
+                current_user.birth,
+                current_user.exp_years,
+                get_occupancy(current_user.id),
+                zoom,
+            )
+        # Inlined into a script element, and tag names are user input
+        payload = str(
+            htmlsafe_json_dumps(rollup, dumps=json.dumps, separators=(",", ":"))
+        )
+        if not reading_replica():
+            user_cache.set(key, payload)
+    yield payload
+
+
+def repair_grid(bitmap: bytes, start: date) -> WeekGrid:
+    # The occupancy bitmap is out of step, e.g. after entries were written
+    # around the app, so build the grid from the entries and repair it. The
+    # rows are dropped on return, rather than held by iter_grid_payload() for
+    # the rest of a streamed render.
+    db_entries = db.session.execute(
+        select(Entry.id, Entry.start).where(Entry.user_id == current_user.id)
+    ).all()
+    grid = generate_all_entries(
+        db_entries=db_entries,
+        birth=current_user.birth,
+        exp_years=current_user.exp_years,
+    )
+    repaired = build_bitmap(start, (e.start for e in db_entries))
+    if repaired != bitmap and not reading_replica():
+        db.session.execute(
+            update(User).where(User.id == current_user.id).values(occupancy=repaired)
+        )
+        db.session.commit()
+    return grid
+
+
+def iter_grid_payload(key: str) -> Iterator[str]:
+    # Packed grid JSON, yielded in pieces as the runs of the occupancy bitmap
+    # are encoded and cached once complete; a cached payload is one piece
+    payload = user_cache.get(key)
+    if payload is not None:
+        yield payload
+        return
+    # Filled weeks come off the occupancy bitmap, and only the ids of the
+    # entries in the grid are read, in week order to match
+    start, n_weeks, past_weeks = grid_bounds(current_user.birth, current_user.exp_years)
+    with timed("grid"):
+        bitmap = get_occupancy(current_user.id)
+        entry_ids = array(
+            "i",
+            db.session.execute(
+                select(Entry.id)
+                .where(
+                    (Entry.user_id == current_user.id)
+                    & (Entry.start >= start)
+                    & (Entry.start < start + datetime.timedelta(weeks=n_weeks))
+                )
+                .order_by(Entry.start)
+                .execution_options(yield_per=GRID_YIELD_PER)
+            ).scalars(),
+        )
+        runs = iter_runs(bitmap, n_weeks)
+        if count_filled(bitmap, n_weeks) != len(entry_ids):
+            grid = repair_grid(bitmap, start)
+            runs, entry_ids = grid.iter_filled_runs(), grid.entry_ids
+    pieces = [
+        '{"birth":"%s","exp_years":%d,"start":"%s","weeks":%d,"past":%d,"runs":['
+        % (
+            current_user.birth.isoformat(),
+            current_user.exp_years,
+            start.isoformat(),
+            n_weeks,
+            past_weeks,
+        )
+    ]
+    yield pieces[-1]
+    runs = (f"[{first},{length}]" for first, length in runs)
+    for piece in iter_json_items(runs):
+        pieces.append(piece)
+        yield piece
+    pieces.append('],"entry_ids":[')
+    yield pieces[-1]
+    for piece in iter_json_items(map(str, entry_ids)):
+        pieces.append(piece)
+        yield piece
+    pieces.append("]}")
+    yield pieces[-1]
+    if not reading_replica():
+        user_cache.set(key, "".join(pieces))
+
+
+def iter_json_items(items: Iterator[str], chunk: int = 512) -> Iterator[str]:
+    # Comma separated JSON array items, joined into pieces of up to chunk items
+    batch = []
+    sep = ""
+    for item in items:
+        batch.append(item)
+        if len(batch) == chunk:
+            yield sep + ",".join(batch)
+            batch.clear()
+            sep = ","
+    if batch:
+        yield sep + ",".join(batch)
+
+
+@bp.route("/")
+@read_only
+def index():
     if current_user.is_anonymous:
         return render_template("index_logged_out.html")
+    # Streamed, so the page header goes out before the grid is computed and
+    # the grid payload follows inline instead of in a second request. The
+    # body is never buffered, so the ETag is derived from the grid cache key,
+    # which changes with any write and each week, rather than hashed over it
+    zoom = current_zoom()
+    key = current_grid_key(zoom)
+    etag = hashlib.sha1(f"{current_app.config['PAGE_VERSION']}:{key}".encode())
+    etag = etag.hexdigest()
+    # Flashes are popped from the session before the headers are sent, as
+    # the session cookie cannot change once streaming starts
+    flashed = bool(get_flashed_messages())
+    if not flashed and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
     else:
-        all_entries = generate_all_entries(
-            db_entries=current_user.entries,
-            birth=current_user.birth,
-            exp_years=current_user.exp_years,
-        )
-        return render_template(
-            "index.html",
-            entries=all_entries,
-            birth_readable=current_user.birth.strftime("%d %B, %Y"),
-            exp_years=current_user.exp_years,
+        # Not make_conditional(), which buffers the stream for Content-Length
+        response = Response(
+            stream_template(
+                "index.html",
+                birth_readable=current_user.birth.strftime("%d %B, %Y"),
+                exp_years=current_user.exp_years,
+                zoom=zoom,
+                zooms=ZOOMS,
+                grid_payload=iter_zoom_payload(key, zoom),
+            )
         )
+    if not flashed:
+        response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@bp.route("/api/grid")
+@read_only
+@login_required
+def api_grid():
+    zoom = current_zoom()
+    payload = "".join(iter_zoom_payload(current_grid_key(zoom), zoom))
+    return conditional_response(Response(payload, mimetype="application/json"))
 
 
-@app.route("/entry/<int:entry_id>")
+@bp.route("/entry/<int:entry_id>")
+@read_only
 @login_required
 def entry(entry_id: str) -> str:
     return render_template("entry.html", entry=get_entry_by_id(entry_id))
 
 
+def set_entry_tags(entry_id: int, tags: list[Tag]):
+    db.session.execute(delete(entry_tag).where(entry_tag.c.entry_id == entry_id))
+    db.session.execute(
+        insert(entry_tag), [{"entry_id": entry_id, "tag_id": t.id} for t in tags]
+    )
+
+
 def entry_helper(edit: bool, entry: Optional[Entry] = None):
     if request.method == "POST":
         start = request.form["start"]
-        tag_names = request.form.getlist("tags[]")
+        tag_names = [t for t in request.form.getlist("tags[]") if t]
         note = request.form["note"]
         if len(tag_names) == 0:
             flash("At least one tag must be selected!", category="danger")
-            tags = None
-        else:
-            tags = get_add_tags(
-                tag_names
-            )  # Gets tags by name or adds new tags if not existing
         start_valid = valid_date(start, only_monday=True, name="Start date")
-        if start_valid and tags:
-            if not edit:  # Check if adding an entry with a date that already exists
-                result = db.session.execute(
-                    select(Entry).where(
-                        (Entry.user_id == current_user.id) & (Entry.start == start)
-                    )
-                ).fetchone()
-                if result is not None and len(result) > 0:  # Entry with date exists
-                    entry = result[0]
-                    edit = True
+        if start_valid and tag_names:
+            moved = edit and date.fromisoformat(start) != entry.start
+            if moved and week_taken(date.fromisoformat(start)):
+                flash(
+                    f"Entry with date {start} already exists; cannot move entry!",
+                    category="danger",
+                )
+                return redirect(url_for("main.edit_entry", entry_id=entry.id))
+            # Gets tags by name or adds new tags if not existing
+            tags, added_tags = get_add_tags(tag_names)
+            if edit:
+                starts = [entry.start, date.fromisoformat(start)]
+                with entries_changed(current_user.id, Entry.start.in_(starts)):
+                    entry.start = date.fromisoformat(start)
+                    entry.tags = tags
+                    entry.note = note
+                flash(f"Successfully edited entry for {start}", category="success")
+            else:  # Add new entry, or edit the existing one with the same date
+                tracked_start = Entry.start == date.fromisoformat(start)
+                with entries_changed(current_user.id, tracked_start):
+                    entry_id = db.session.execute(
+                        upsert(Entry)
+                        .values(
+                            user_id=current_user.id,
+                            start=date.fromisoformat(start),
+                            note=note,
+                        )
+                        .on_conflict_do_nothing(index_elements=["user_id", "start"])
+                        .returning(Entry.id)
+                    ).scalar()
+                    inserted = entry_id is not None
+                    if not inserted:  # Unique index hit, update the existing entry
+                        entry_id = db.session.execute(
+                            update(Entry)
+                            .where(
+                                (Entry.user_id == current_user.id)
+                                & (Entry.start == date.fromisoformat(start))
+                            )
+                            .values(note=note)
+                            .returning(Entry.id)
+                        ).scalar_one()
+                    set_entry_tags(entry_id, tags)
+                if inserted:
+                    flash(f"Successfully added entry for {start}", category="success")
+                else:
                     flash(
                         f"Entry with specified date already exists. Edited existing entry for {start}!",
                         category="warning",
                     )
-            if edit:
-                entry.start = date.fromisoformat(start)
-                entry.tags = tags
-                entry.note = note
-                flash(f"Successfully edited entry for {start}", category="success")
-            else:  # Add new entry
-                db.session.add(
-                    Entry(
-                        user_id=current_user.id,
-                        start=date.fromisoformat(start),
-                        tags=tags,
-                        note=note,
-                    )
-                )
-                flash(f"Successfully added entry for {start}", category="success")
             db.session.commit()
-            return redirect(url_for("index"))
+            invalidate_user_cache(current_user.id)
+            flash_added_tags(added_tags)
+            return redirect(url_for("main.index"))
+    bitmap = get_occupancy(current_user.id)
     if edit:
         existing_entry_dates = json.dumps(
-            [
-                x.start.isoformat()
-                for x in current_user.entries
-                if x.start != entry.start
-            ]
+            filled_dates(bitmap, current_user.birth, exclude=entry.start)
         )
         return render_template(
             "edit.html",
-            tags=current_user.tags,
+            tags=get_user_tags(),
             disabled_dates=existing_entry_dates,
             entry=entry,
         )
     else:  # Add new entry
-        existing_entry_dates = json.dumps(
-            [x.start.isoformat() for x in current_user.entries]
-        )
+        existing_entry_dates = json.dumps(filled_dates(bitmap, current_user.birth))
         date_today = datetime.datetime.now().date()
         return render_template(
             "add.html",
-            tags=current_user.tags,
+            tags=get_user_tags(),
             disabled_dates=existing_entry_dates,
             default_date=date_today - datetime.timedelta(days=date_today.weekday()),
         )
 
 
-@app.route("/entry/add", methods=("GET", "POST"))
+@bp.route("/entry/add", methods=("GET", "POST"))
 @login_required
 def add_entry():
     return entry_helper(edit=False)
 
 
-@app.route("/entry/<int:entry_id>/edit", methods=("GET", "POST"))
+@bp.route("/entry/<int:entry_id>/edit", methods=("GET", "POST"))
 @login_required
 def edit_entry(entry_id: str):
     return entry_helper(edit=True, entry=get_entry_by_id(entry_id))
 
 
-@app.route("/entry/<int:entry_id>/delete", methods=("POST",))
+def batch_weeks(form) -> Optional[list[date]]:
+    # The Mondays picked in the batch form, either as a comma separated list
+    # or as a range from a Monday to an end date, or None if invalid. Their
+    # number is checked before they are built, as a range can span millennia.
+    picked = [w.strip() for w in form.get("weeks", "").split(",") if w.strip()]
+    if picked:
+        n_weeks = len(picked)
+    else:
+        start, end = form.get("start"), form.get("end")
+        if not (
+            valid_date(start, only_monday=True, name="Start date")
+            and valid_date(end, name="End date")
+        ):
+            return None
+        start = datetime.datetime.fromisoformat(start).date()
+        end = datetime.datetime.fromisoformat(end).date()
+        n_weeks = (end - start).days // 7 + 1
+    if n_weeks <= 0:
+        flash("At least one week must be selected!", category="danger")
+        return None
+    if n_weeks > BATCH_MAX_WEEKS:
+        flash(
+            f"At most {BATCH_MAX_WEEKS} weeks can be edited at once!", category="danger"
+        )
+        return None
+    if not picked:
+        return [start + datetime.timedelta(weeks=i) for i in range(n_weeks)]
+    if not all(valid_date(w, only_monday=True, name="Week") for w in picked):
+        return None
+    return sorted({datetime.datetime.fromisoformat(w).date() for w in picked})
+
+
+def upsert_week_entries(
+    user_id: int, weeks: list[date], tags: list[Tag], note: str, replace: bool
+) -> tuple[int, int]:
+    """Creates or updates the user's entries for the given weeks with one
+    upsert, then links them to tags with one bulk insert. Unless replace is
+    set, existing entries keep their tags and, if note is empty, their note.
+    Returns the numbers of entries created and updated; the caller commits."""
+    changed = Entry.start.in_(weeks)
+    existing = db.session.execute(
+        select(func.count()).where((Entry.user_id == user_id) & changed)
+    ).scalar_one()
+    with entries_changed(user_id, changed):
+        statement = upsert(Entry).values(
+            [{"user_id": user_id, "start": w, "note": note} for w in weeks]
+        )
+        keep_note = not replace and not note
+        entry_ids = (
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["user_id", "start"],
+                    set_={"note": Entry.note if keep_note else statement.excluded.note},
+                ).returning(Entry.id)
+            )
+            .scalars()
+            .all()
+        )
+        if replace:
+            db.session.execute(
+                delete(entry_tag).where(entry_tag.c.entry_id.in_(entry_ids))
+            )
+        db.session.execute(
+            upsert(entry_tag).on_conflict_do_nothing(
+                index_elements=["entry_id", "tag_id"]
+            ),
+            [{"entry_id": e, "tag_id": t.id} for e in entry_ids for t in tags],
+        )
+    return len(weeks) - existing, existing
+
+
+@bp.route("/entry/batch", methods=("GET", "POST"))
+@login_required
+def batch_entries():
+    if request.method == "POST":
+        tag_names = [t for t in request.form.getlist("tags[]") if t]
+        if len(tag_names) == 0:
+            flash("At least one tag must be selected!", category="danger")
+        weeks = batch_weeks(request.form)
+        if tag_names and weeks:
+            tags, added_tags = get_add_tags(tag_names)
+            created, updated = upsert_week_entries(
+                current_user.id,
+                weeks,
+                tags,
+                request.form.get("note", ""),
+                replace=bool(request.form.get("replace")),
+            )
+            db.session.commit()
+            invalidate_user_cache(current_user.id)
+            flash_added_tags(added_tags)
+            flash(
+                f"Created {created} and updated {updated} entries from {weeks[0]}"
+                f" to {weeks[-1]}!",
+                category="success",
+            )
+            return redirect(url_for("main.index"))
+    return render_template("batch.html", tags=get_user_tags())
+
+
+@bp.route("/entry/<int:entry_id>/delete", methods=("POST",))
 @login_required
 def delete_entry(entry_id: str):
     entry = get_entry_by_id(entry_id)
     entry_start = entry.start
-    db.session.delete(entry)
+    with entries_changed(current_user.id, Entry.start == entry_start):
+        db.session.delete(entry)
     db.session.commit()
+    invalidate_user_cache(current_user.id)
     flash(
         f"Entry starting on {entry_start} was successfully deleted!", category="success"
     )
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 
-@app.route("/user/<int:user_id>/delete", methods=("POST",))
+@bp.route("/user/<int:user_id>/delete", methods=("POST",))
 @login_required
 def delete_user(user_id: str):
     if user_id != current_user.id:
         abort(404)
-    User.query.filter(User.id == user_id).delete()
-    db.session.commit()
+    done = delete_account(user_id)
+    invalidate_user_cache(user_id)
     logout_user()
-    flash(
-        f"Account and all associated entries were successfully deleted!",
-        category="success",
-    )
-    return redirect(url_for("index"))
+    if done:
+        flash(
+            f"Account and all associated entries were successfully deleted!",
+            category="success",
+        )
+    else:
+        flash(
+            "Account deleted! Its entries are being removed in the background.",
+            category="success",
+        )
+    return redirect(url_for("main.index"))
 
 
 def valid_tag_name_color(name: str, color: str) -> bool:
@@ -253,14 +776,93 @@ def valid_tag_name_color(name: str, color: str) -> bool:
     return valid
 
 
-@app.route("/tags")
+@bp.route("/export.<fmt>")
+@read_only
 @login_required
-def tags() -> str:
-    return render_template(
-        "tags.html", tags=sorted(current_user.tags, key=lambda t: t.created)
+def export_entries(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    rows = (
+        export_ndjson(current_user.id)
+        if fmt == "ndjson"
+        else export_csv(current_user.id)
+    )
+    return Response(
+        stream_with_context(rows),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename=lifecal.{fmt}"},
     )
 
 
+@bp.route("/import", methods=("POST",))
+@login_required
+def import_entries_route():
+    too_large = f"Files to import may be at most {IMPORT_MAX_BYTES // 2**20} MiB!"
+    try:
+        file = request.files.get("file")
+    except RequestEntityTooLarge:  # Over MAX_CONTENT_LENGTH, so never read
+        flash(too_large, category="danger")
+        return redirect(url_for("main.settings"))
+    if file is None or not file.filename:
+        flash("A file to import is required!", category="danger")
+        return redirect(url_for("main.settings"))
+    fmt = "csv" if file.filename.endswith(".csv") else "ndjson"
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    if size > IMPORT_MAX_BYTES:
+        flash(too_large, category="danger")
+        return redirect(url_for("main.settings"))
+    try:
+        text = file.stream.read().decode("utf-8")
+    except UnicodeDecodeError:
+        flash("The file to import must be UTF-8 encoded text!", category="danger")
+        return redirect(url_for("main.settings"))
+    if size > IMPORT_INLINE_MAX_BYTES:
+        # The form's key makes a resubmitted upload return the same job
+        key = request.form.get("idempotency_key")
+        enqueue(
+            "import_entries",
+            {"user_id": current_user.id, "fmt": fmt, "text": text},
+            user_id=current_user.id,
+            key=f"import:{current_user.id}:{key[:64]}" if key else None,
+        )
+        db.session.commit()
+        flash(
+            "The file is being imported in the background, see below.",
+            category="primary",
+        )
+        return redirect(url_for("main.settings"))
+    lines = io.StringIO(text, newline="")
+    result = import_entries(current_user.id, parse_rows(lines, fmt))
+    invalidate_user_cache(current_user.id)
+    for error in result.errors[:10]:
+        flash(error, category="danger")
+    flash(str(result), category="success" if result.rows else "warning")
+    return redirect(url_for("main.settings"))
+
+
+@bp.cli.command("import-entries")
+@click.argument("user_id", type=int)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_entries_command(user_id: int, path: str):
+    """Import entries for a user from an NDJSON or CSV export."""
+    with open(path, encoding="utf-8", newline="") as f:
+        fmt = "csv" if path.endswith(".csv") else "ndjson"
+        result = import_entries(user_id, parse_rows(f, fmt))
+    user_cache.bump(user_id)
+    for error in result.errors:
+        print(error)
+    print(result)
+
+
+@bp.route("/tags")
+@read_only
+@login_required
+def tags() -> str:
+    return render_template("tags.html", tags=get_user_tags())
+
+
 def add_tag_helper(name: str, color: str = "0000FFFF", return_tag=False):
     valid = valid_tag_name_color(name, color)
     if (
@@ -281,21 +883,24 @@ def add_tag_helper(name: str, color: str = "0000FFFF", return_tag=False):
             color=color,
         )
         db.session.add(new_tag)
+        db.session.flush()
+        tags_revised(current_user.id, [new_tag.id])
         db.session.commit()
+        invalidate_user_cache(current_user.id)
         flash(f"Added tag f{name}!", category="success")
         if return_tag:
             db.session.refresh(new_tag)
             return new_tag
 
 
-@app.route("/tag/add", methods=("POST",))
+@bp.route("/tag/add", methods=("POST",))
 @login_required
 def add_tag():
     add_tag_helper(request.form["name"], request.form["color"], return_tag=False)
-    return redirect(url_for("tags"))
+    return redirect(url_for("main.tags"))
 
 
-@app.route("/tag/<int:tag_id>/edit", methods=("POST",))
+@bp.route("/tag/<int:tag_id>/edit", methods=("POST",))
 @login_required
 def edit_tag(tag_id: str):
     tag = get_tag_by_id(tag_id)
@@ -316,50 +921,78 @@ def edit_tag(tag_id: str):
         )
         valid = False
     if valid:
-        tag.name = request.form["name"]
-        tag.color = request.form["color"]
+        # Tag names are part of the indexed text of every entry with the tag
+        with indexed(current_user.id, entry_tag.c.tag_id == tag.id):
+            tag.name = request.form["name"]
+            tag.color = request.form["color"]
+        tags_revised(current_user.id, [tag.id])
         db.session.commit()
-    return redirect(url_for("tags"))
+        invalidate_user_cache(current_user.id)
+    return redirect(url_for("main.tags"))
 
 
-@app.route("/tag/<int:tag_id>/delete", methods=("POST",))
+@bp.route("/tag/<int:tag_id>/delete", methods=("POST",))
 @login_required
 def delete_tag(tag_id: str):
     tag = get_tag_by_id(tag_id)
     tag_name = tag.name
-    db.session.delete(tag)
+    with entries_changed(current_user.id, entry_tag.c.tag_id == tag.id):
+        delete_tag_rows(db.session, tag.id)
+    tags_revised(current_user.id, [tag.id])
     db.session.commit()
+    invalidate_user_cache(current_user.id)
     flash(f"Tag {tag_name} was successfully deleted!", category="success")
-    return redirect(url_for("tags"))
+    return redirect(url_for("main.tags"))
+
+
+@bp.route("/tag/<int:tag_id>/merge", methods=("POST",))
+@login_required
+def merge_tag(tag_id: str):
+    tag = get_tag_by_id(tag_id)
+    into = get_tag_by_id(request.form.get("into", type=int))
+    if into.id == tag.id:
+        flash("Cannot merge a tag into itself!", category="danger")
+        return redirect(url_for("main.tags"))
+    tag_name = tag.name
+    with entries_changed(current_user.id, entry_tag.c.tag_id.in_([tag.id, into.id])):
+        # Entries that already carry both tags keep their link to the target
+        db.session.execute(
+            update(entry_tag)
+            .where(
+                (entry_tag.c.tag_id == tag.id)
+                & entry_tag.c.entry_id.not_in(
+                    select(entry_tag.c.entry_id).where(entry_tag.c.tag_id == into.id)
+                )
+            )
+            .values(tag_id=into.id)
+        )
+        db.session.execute(delete(entry_tag).where(entry_tag.c.tag_id == tag.id))
+        db.session.execute(delete(Tag).where(Tag.id == tag.id))
+    tags_revised(current_user.id, [tag.id])
+    db.session.commit()
+    invalidate_user_cache(current_user.id)
+    flash(f"Tag {tag_name} was merged into {into.name}!", category="success")
+    return redirect(url_for("main.tags"))
 
 
 def valid_date(date: str, only_monday=False, name="Date") -> bool:
-    if not date:
-        flash(f"{name} is required!", category="danger")
-        return False
-    try:
-        date = datetime.datetime.fromisoformat(date)
-        if only_monday and date.weekday() != 0:
-            flash(f"{name} must be a Monday (start of week)", category="danger")
-            return False
-        else:
-            return True
-    except:
-        flash(f"{name} is required to be in YYYY-MM-DD format", category="danger")
+    error = date_error(date, only_monday=only_monday, name=name)
+    if error is not None:
+        flash(error, category="danger")
         return False
+    return True
 
 
-def get_add_tags(tag_names: list[str]) -> list[Tag]:
-    tags_db = []
-    for t in tag_names:
-        result = db.session.execute(
-            select(Tag).where((Tag.name == t) & (Tag.user_id == current_user.id))
-        ).fetchone()
-        if result is not None:
-            tags_db.append(result[0])
-        else:
-            tags_db.append(add_tag_helper(t, return_tag=True))
-    return tags_db
+def get_add_tags(tag_names: list[str]) -> tuple[list[Tag], list[str]]:
+    # The added names are flashed with flash_added_tags() once the caller has
+    # committed, as a failed write rolls the new tags back
+    tags_db, created = get_or_create_tags(current_user.id, tag_names)
+    return list(tags_db.values()), created
+
+
+def flash_added_tags(created: list[str]):
+    if created:
+        flash(f"Added tags {', '.join(created)}!", category="success")
 
 
 def valid_exp_years(exp_years: str) -> bool:
@@ -375,7 +1008,8 @@ def valid_exp_years(exp_years: str) -> bool:
     return True
 
 
-@app.route("/settings", methods=("GET", "POST"))
+@bp.route("/settings", methods=("GET", "POST"))
+@read_only
 @login_required
 def settings():
     if request.method == "POST":
@@ -385,97 +1019,160 @@ def settings():
             birth, name="Date of birth"
         ), valid_exp_years(exp_years)
         if valid_birth and valid_years:
-            user = db.session.execute(
-                select(User).where(User.id == current_user.id)
-            ).fetchone()[0]
+            user = db.session.get(User, current_user.id)  # From the identity map
+            birth_changed = user.birth != date.fromisoformat(birth)
             user.birth = date.fromisoformat(birth)
             user.exp_years = exp_years
+            db.session.flush()
+            if birth_changed:  # Week indexes count from the birth week
+                rebuild_occupancy(db.session, user.id)
+            settings_revised(user.id)
             db.session.commit()
+            invalidate_user_cache(current_user.id)
             flash("Settings were successfully updated!", category="success")
-            return redirect(url_for("settings"))
+            return redirect(url_for("main.settings"))
     return render_template(
-        "settings.html", birth=current_user.birth, exp_years=current_user.exp_years
+        "settings.html",
+        birth=current_user.birth,
+        exp_years=current_user.exp_years,
+        jobs=recent_jobs(current_user.id),
+        idempotency_key=token_urlsafe(16),
     )
 
 
-@app.route("/login")
+@bp.route("/stats")
+@read_only
+@login_required
+def stats():
+    tag_stats = get_tag_stats(current_user.id)
+    years = sorted({year for t in tag_stats for year in t["years"]})
+    return render_template("stats.html", tag_stats=tag_stats, years=years)
+
+
+@bp.route("/api/stats")
+@read_only
+@login_required
+def api_stats():
+    return {"tags": get_tag_stats(current_user.id)}
+
+
+@bp.route("/api/changes")
+@read_only
+@login_required
+def api_changes():
+    since = request.args.get("since")
+    if since is not None:
+        if not since.isdigit():
+            abort(400)
+        since = int(since)
+    limit = min(request.args.get("limit", CHANGES_PAGE_SIZE, type=int), 5000)
+    return get_changes(current_user.id, since, max(limit, 1))
+
+
+@bp.route("/api/jobs/<int:job_id>")
+@login_required
+def api_job(job_id: int):
+    # Not read_only, as status polls must not lag behind the worker
+    job = get_job(current_user.id, job_id)
+    if job is None:
+        abort(404)
+    return job_status(job)
+
+
+@bp.route("/api/search")
+@read_only
+@login_required
+def api_search():
+    after = None
+    if request.args.get("after"):
+        try:
+            score, start = request.args["after"].split("_")
+            after = float(score), date.fromisoformat(start)
+        except ValueError:
+            abort(400)
+    limit = min(request.args.get("limit", SEARCH_PAGE_SIZE, type=int), 100)
+    results, cursor = search_entries(
+        current_user.id, request.args.get("q", ""), after=after, limit=max(limit, 1)
+    )
+    return {
+        "results": results,
+        "next": f"{cursor[0]!r}_{cursor[1].isoformat()}" if cursor else None,
+    }
+
+
+@bp.route("/login")
 def login() -> str:
     return render_template("login.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("Successfully signed out!", category="success")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 
-@app.route("/authorize/<provider>")
+@bp.route("/authorize/<provider>")
 def oauth2_authorize(provider):
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
-    if provider not in app.config["OAUTH2_PROVIDERS"]:
+        return redirect(url_for("main.index"))
+    if provider not in oauth2_providers():
         abort(404)
     else:
-        provider_info = app.config["OAUTH2_PROVIDERS"][provider]
+        provider_info = oauth2_providers()[provider]
     session["oauth2_state"] = token_urlsafe(16)
     query = urlencode(
         {
             "client_id": provider_info["client_id"],
             "redirect_uri": url_for(
-                "oauth2_callback", provider=provider, _external=True
+                "main.oauth2_callback", provider=provider, _external=True
             ),
             "response_type": "code",
             "scope": " ".join(provider_info["scopes"]),
             "state": session["oauth2_state"],
+            **(
+                {"login_hint": request.args["login_hint"]}
+                if "login_hint" in request.args
+                else {}
+            ),
         }
     )
     return redirect(provider_info["authorize_url"] + "?" + query)
 
 
-@app.route("/callback/<provider>")
+@bp.route("/callback/<provider>")
 def oauth2_callback(provider):
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
-    if provider not in app.config["OAUTH2_PROVIDERS"]:
+        return redirect(url_for("main.index"))
+    if provider not in oauth2_providers():
         abort(404)
     else:
-        provider_info = app.config["OAUTH2_PROVIDERS"][provider]
+        provider_info = oauth2_providers()[provider]
     if "error" in request.args:
         flash(request.args.items(), category="danger")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     if request.args["state"] != session.get("oauth2_state"):
         abort(401)
     if "code" not in request.args:
         abort(401)
-    response = requests.post(
-        provider_info["token_url"],
-        data={
-            "client_id": provider_info["client_id"],
-            "client_secret": provider_info["client_secret"],
-            "code": request.args["code"],
-            "grant_type": "authorization_code",
-            "redirect_uri": url_for(
-                "oauth2_callback", provider=provider, _external=True
+    try:
+        oauth2_token = oauth_client.fetch_token(
+            provider,
+            provider_info,
+            code=request.args["code"],
+            redirect_uri=url_for(
+                "main.oauth2_callback", provider=provider, _external=True
             ),
-        },
-        headers={"Accept": "application/json"},
-    )
-    if response.status_code != 200:
-        abort(401)
-    oauth2_token = response.json()["access_token"]
-    if not oauth2_token:
-        abort(401)
-    response = requests.get(
-        provider_info["userinfo"]["url"],
-        headers={
-            "Authorization": "Bearer " + oauth2_token,
-            "Accept": "application/json",
-        },
-    )
-    if response.status_code != 200:
-        abort(401)
+        )
+        response = oauth_client.fetch_userinfo(provider, provider_info, oauth2_token)
+    except OAuthError as e:
+        current_app.logger.warning("Sign in failed: %s", e)
+        flash(
+            "Sign in failed or timed out, please try again!",
+            category="danger",
+        )
+        return redirect(url_for("main.index"))
     # Get or add user
     oauth_id = provider_info["userinfo"]["oauth_id"](response)
     user, is_new_user = get_create_user_by_oauth_id(oauth_id)
@@ -485,11 +1182,13 @@ def oauth2_callback(provider):
             "Welcome to your new account. Please set your date of birth and life expectancy here.",
             category="primary",
         )
-        return redirect(url_for("settings"))
+        return redirect(url_for("main.settings"))
     else:
         flash("You have been signed in. Welcome back!", category="success")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
 
 if __name__ == "__main__":
+    app = create_app()
+    start_worker_thread(app)  # In production, `flask --app app run-jobs`
     app.run()
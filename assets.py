@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import brotli
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+# Encodings of the precompressed copies, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE = (".css", ".js", ".json", ".svg", ".txt", ".map")
+BUILD_DIR = "dist"
+MANIFEST = "manifest.json"
+
+
+def fingerprinted(path: str, digest: str) -> str:
+    # css/style.css -> css/style.3f2a1b9c0d.css
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def build_assets(static_folder: str) -> dict[str, str]:
+    """Copies every static file into static_folder/dist under a name with a
+    hash of its content, next to Brotli and gzip copies of text files, and
+    writes the manifest mapping original to fingerprinted paths. Files that
+    are already built are kept, as their names only change with their
+    content, and files of older builds are removed."""
+    out_dir = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder and BUILD_DIR in dirs:
+            dirs.remove(BUILD_DIR)
+        for name in files:
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            manifest[path] = fingerprinted(path, hashlib.sha256(data).hexdigest()[:10])
+            target = os.path.join(out_dir, manifest[path])
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if name.endswith(COMPRESSIBLE):
+                with open(target + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+                with open(target + ".gz", "wb") as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    built = {os.path.join(out_dir, MANIFEST)}
+    for path in manifest.values():
+        target = os.path.join(out_dir, path)
+        built.update([target, target + ".br", target + ".gz"])
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            if os.path.join(root, name) not in built:
+                os.remove(os.path.join(root, name))
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """Serves the fingerprinted static files made by build_assets() at
+    /dist/, precompressed according to Accept-Encoding and cached by browsers
+    for a year, as their URLs change with their content. Templates link
+    static files with asset_url(), which falls back to the plain static URL
+    for files not built, e.g. when running locally without a build."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ASSETS_DIR", os.path.join(app.static_folder, BUILD_DIR))
+        try:
+            with open(os.path.join(app.config["ASSETS_DIR"], MANIFEST)) as f:
+                app.config["ASSETS_MANIFEST"] = json.load(f)
+        except FileNotFoundError:
+            app.config["ASSETS_MANIFEST"] = {}
+        app.add_url_rule("/dist/<path:filename>", "asset", self.asset_view)
+        app.add_template_global(asset_url)
+        app.extensions["assets"] = self
+
+    def asset_view(self, filename: str):
+        directory = current_app.config["ASSETS_DIR"]
+        max_age = 365 * 24 * 3600
+        for encoding, suffix in ENCODINGS:
+            path = safe_join(directory, filename + suffix)
+            if request.accept_encodings[encoding] and path and os.path.isfile(path):
+                # Typed as the original file, not as a .br or .gz download
+                response = send_from_directory(
+                    directory,
+                    filename + suffix,
+                    mimetype=mimetypes.guess_type(filename)[0],
+                    max_age=max_age,
+                )
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(directory, filename, max_age=max_age)
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def asset_url(filename: str) -> str:
+    path = current_app.config["ASSETS_MANIFEST"].get(filename)
+    if path is None:
+        return url_for("static", filename=filename)
+    return url_for("asset", filename=path)
+
+
+assets = Assets()
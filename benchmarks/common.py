@@ -0,0 +1,51 @@
+"""Shared setup for benchmarks that drive the real app against a throwaway
+SQLite database."""
+
+import os
+import tempfile
+import time
+
+
+def load_app(database_url: str = None, seed_test_user=True, **config):
+    # create_app() reads secrets from the environment on Fly, so point it at a
+    # fresh SQLite database (unless given another one) and dummy secrets
+    if database_url is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="lifecal-bench-"), "bench.db")
+        database_url = f"sqlite:///{db_path}"
+    os.environ.setdefault("LIFECAL_ENV", "FLY")
+    for name in (
+        "FLASK_SECRET_KEY",
+        "GITHUB_CLIENT_ID",
+        "GITHUB_CLIENT_SECRET",
+        "GOOGLE_CLIENT_ID",
+        "GOOGLE_CLIENT_SECRET",
+    ):
+        os.environ.setdefault(name, "benchmark")
+    os.environ["DATABASE_URL"] = database_url
+    if seed_test_user:
+        os.environ["INIT_DB"] = "1"
+    else:
+        os.environ.pop("INIT_DB", None)
+    from app import create_app
+
+    return create_app(config)
+
+
+def logged_in_client(app, user_id: int = 1):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
+
+
+def requests_per_second(client, path: str, seconds: float = 2.0) -> float:
+    n = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        response = client.get(path)
+        assert response.status_code == 200, response.status_code
+        response.get_data()  # Streamed bodies are generated as they are read
+        response.close()
+        n += 1
+    return n / (time.perf_counter() - started)
@@ -0,0 +1,79 @@
+"""Bytes on the wire for a first visit to GET / with a 120 year grid, and
+for the static files it links to, by Accept-Encoding: the page as sent before
+compression, then gzip and Brotli. Also times each encoding of GET /.
+
+Run from the repo root: python -m benchmarks.compression [requests]
+"""
+
+import datetime
+import statistics
+import sys
+import time
+
+from sqlalchemy import insert, update
+
+from assets import build_assets
+from benchmarks.common import load_app, logged_in_client
+from grid import grid_start
+from models import db, Entry, User
+
+EXP_YEARS = 120
+STATIC_FILES = ("css/style.css", "js/grid.js", "assets/logo.jpg")
+
+
+def wire_bytes(client, path: str, encoding: str) -> int:
+    response = client.get(path, headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200, response.status_code
+    size = len(response.data)
+    response.close()
+    return size
+
+
+def median_ms(client, path: str, encoding: str, requests: int) -> float:
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        wire_bytes(client, path, encoding)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(requests: int = 20):
+    app = load_app()
+    app.config["ASSETS_MANIFEST"] = build_assets(app.static_folder)
+    with app.app_context():
+        user = db.session.get(User, 1)
+        start = grid_start(user.birth)
+        weeks_lived = (datetime.date.today() - start).days // 7
+        db.session.execute(update(User).where(User.id == 1).values(exp_years=EXP_YEARS))
+        db.session.execute(
+            insert(Entry).prefix_with("OR IGNORE"),
+            [
+                {"user_id": 1, "start": start + datetime.timedelta(weeks=w)}
+                for w in range(0, weeks_lived, 2)
+            ],
+        )
+        db.session.commit()
+    manifest = app.config["ASSETS_MANIFEST"]
+    client = logged_in_client(app)
+    print(f"{'':<8} {'GET / B':>9} {'static B':>9} {'total B':>9} {'GET / ms':>9}")
+    for label, encoding in (
+        ("before", "identity"),
+        ("gzip", "gzip"),
+        ("br", "br, gzip"),
+    ):
+        # Before, the static files were served uncompressed from /static
+        paths = [
+            f"/static/{f}" if label == "before" else f"/dist/{manifest[f]}"
+            for f in STATIC_FILES
+        ]
+        page = wire_bytes(client, "/", encoding)
+        static = sum(wire_bytes(client, path, encoding) for path in paths)
+        print(
+            f"{label:<8} {page:9d} {static:9d} {page + static:9d}"
+            f" {median_ms(client, '/', encoding, requests):9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""Deleting an account with 5,000 tagged, annotated entries: through the ORM
+cascade, which loads every entry and tag first, with one set-based statement
+per table, and through POST /user/<id>/delete, which answers at once and
+queues a job purging it in chunks, run here by the job runner. Reports time and peak Python memory, and
+checks that no rows are left behind.
+
+Run from the repo root: python -m benchmarks.deletion [entries]
+"""
+
+import datetime
+import sys
+import time
+import tracemalloc
+
+from sqlalchemy import func, insert, select, text
+
+from benchmarks.common import load_app, logged_in_client
+from deletion import delete_user_rows
+from jobs import run_jobs
+from migrations import upgrade_db
+from models import db, entry_tag, Entry, Tag, TagStat, User
+from search import rebuild_search_index
+from stats import rebuild_tag_stats
+
+N_TAGS = 10
+
+
+def add_user(n_entries: int) -> int:
+    start = datetime.date(1950, 1, 2)
+    user_id = db.session.execute(
+        insert(User)
+        .values(oauth_id=f"delete_{time.time_ns()}", birth=start, exp_years=120)
+        .returning(User.id)
+    ).scalar_one()
+    tag_ids = (
+        db.session.execute(
+            insert(Tag)
+            .values(
+                [
+                    {"user_id": user_id, "name": f"Tag {t}", "color": "#ff0000"}
+                    for t in range(N_TAGS)
+                ]
+            )
+            .returning(Tag.id)
+        )
+        .scalars()
+        .all()
+    )
+    entry_ids = (
+        db.session.execute(
+            insert(Entry).returning(Entry.id),
+            [
+                {
+                    "user_id": user_id,
+                    "start": start + datetime.timedelta(weeks=w),
+                    "note": f"Week {w} of a long and eventful life",
+                }
+                for w in range(n_entries)
+            ],
+        )
+        .scalars()
+        .all()
+    )
+    db.session.execute(
+        insert(entry_tag),
+        [
+            {"entry_id": entry_id, "tag_id": tag_ids[(i + k) % N_TAGS]}
+            for i, entry_id in enumerate(entry_ids)
+            for k in (0, 1)
+        ],
+    )
+    rebuild_tag_stats(db.session, user_id)
+    rebuild_search_index(db.session, user_id)
+    db.session.commit()
+    return user_id
+
+
+def rows_left(user_id: int) -> int:
+    entries = select(Entry.id).where(Entry.user_id == user_id)
+    return sum(
+        db.session.execute(statement).scalar_one()
+        for statement in (
+            select(func.count()).select_from(User).where(User.id == user_id),
+            select(func.count()).select_from(Entry).where(Entry.user_id == user_id),
+            select(func.count()).select_from(Tag).where(Tag.user_id == user_id),
+            select(func.count()).where(entry_tag.c.entry_id.in_(entries)),
+            select(func.count()).where(TagStat.user_id == user_id),
+            text(
+                "SELECT COUNT(*) FROM entry_search WHERE user_id = :user_id"
+            ).bindparams(user_id=user_id),
+        )
+    )
+
+
+def orm_cascade(user_id: int):
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+
+
+def set_based(user_id: int):
+    delete_user_rows(db.session, user_id)
+    db.session.commit()
+
+
+def report(label: str, seconds: float, peak: int, left: str):
+    print(f"{label:<28} {seconds * 1000:9.1f} {peak / 1024:9.1f} {left:>5}")
+
+
+def main(n_entries: int = 5000):
+    app = load_app(seed_test_user=False)
+    upgrade_db(app)
+    print(f"{n_entries} entries")
+    print(f"{'':<28} {'ms':>9} {'peak KiB':>9} {'left':>5}")
+    with app.app_context():
+        for label, delete_user in (
+            ("ORM cascade", orm_cascade),
+            ("set-based, one transaction", set_based),
+        ):
+            user_id = add_user(n_entries)
+            db.session.remove()
+            tracemalloc.start()
+            started = time.perf_counter()
+            delete_user(user_id)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report(label, elapsed, peak, rows_left(user_id))
+        user_id = add_user(n_entries)
+        db.session.remove()
+    client = logged_in_client(app, user_id)
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.post(f"/user/{user_id}/delete")
+    answered = time.perf_counter() - started
+    assert response.status_code == 302, response.status_code
+    with app.app_context():
+        run_jobs(once=True)
+        purged = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report("POST, until answered", answered, peak, "")
+        report("POST, until purged", purged, peak, rows_left(user_id))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,59 @@
+"""Micro-benchmark for the life grid: old per-week loop vs grid.generate_week_grid.
+
+Run from the repo root: python -m benchmarks.grid
+"""
+
+import datetime
+import timeit
+from collections import namedtuple
+from datetime import date
+
+from grid import generate_week_grid, grid_end, grid_start
+
+FakeEntry = namedtuple("FakeEntry", ["id", "start"])
+
+BIRTH = date.fromisoformat("1995-03-08")
+
+
+def legacy_generate_all_entries(db_entries, birth, exp_years):
+    db_entries_dict = {x.start: x for x in db_entries}
+    start = grid_start(birth)
+    end = grid_end(start, exp_years)
+    all_entries = []
+    curr = start
+    while curr <= end:
+        is_past = curr < datetime.datetime.now().date()
+        entry = db_entries_dict[curr] if curr in db_entries_dict else None
+        all_entries.append((curr, is_past, entry))
+        curr += datetime.timedelta(weeks=1)
+    return all_entries
+
+
+def fake_entries(birth: date, n: int) -> list[FakeEntry]:
+    start = grid_start(birth)
+    return [FakeEntry(i, start + datetime.timedelta(weeks=2 * i)) for i in range(n)]
+
+
+def main(number: int = 200):
+    entries = fake_entries(BIRTH, 500)
+    print(
+        f"{'exp_years':>9} {'weeks':>6} {'legacy ms':>10} {'grid ms':>8} {'speedup':>8}"
+    )
+    for exp_years in (80, 100, 120):
+        grid = generate_week_grid(entries, BIRTH, exp_years)
+        assert list(grid) == legacy_generate_all_entries(entries, BIRTH, exp_years)
+        legacy = timeit.timeit(
+            lambda: legacy_generate_all_entries(entries, BIRTH, exp_years),
+            number=number,
+        )
+        new = timeit.timeit(
+            lambda: generate_week_grid(entries, BIRTH, exp_years), number=number
+        )
+        print(
+            f"{exp_years:>9} {len(grid):>6} {legacy / number * 1000:>10.3f}"
+            f" {new / number * 1000:>8.3f} {legacy / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Python memory held, and at peak, by 100 concurrent renders of a 120 year grid with an
+entry in every past week, held at once as they would be by one worker: the
+old list of (date, is_past, Entry) tuples over ORM entries, each render with
+its own session, vs WeekGrid over (id, start) rows. Also fires 100
+concurrent GET /api/grid requests with the grid cache off.
+
+Run from the repo root: python -m benchmarks.grid_memory [renders] [budget_kib]
+Exits with status 1 if each WeekGrid render holds more than budget_kib.
+"""
+
+import datetime
+import sys
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from benchmarks.common import load_app, logged_in_client
+from benchmarks.grid import legacy_generate_all_entries
+from cache import NullCache, user_cache
+from grid import generate_week_grid, grid_start
+from models import db, Entry, User
+from occupancy import rebuild_occupancy
+
+EXP_YEARS = 120
+
+
+def populate() -> User:
+    birth = datetime.date.today() - datetime.timedelta(days=100 * 365)
+    db.session.execute(
+        update(User).where(User.id == 1).values(birth=birth, exp_years=EXP_YEARS)
+    )
+    start = grid_start(birth)
+    db.session.execute(
+        insert(Entry).prefix_with("OR IGNORE"),
+        [
+            {
+                "user_id": 1,
+                "start": start + datetime.timedelta(weeks=w),
+                "note": f"Week {w} of a long and eventful life",
+            }
+            for w in range((datetime.date.today() - start).days // 7)
+        ],
+    )
+    rebuild_occupancy(db.session, 1)
+    db.session.commit()
+    return db.session.get(User, 1)
+
+
+def orm_render(user: User):
+    # The entries stay loaded in the session, but its connection is released
+    session = Session(db.engine, expire_on_commit=False)
+    entries = session.execute(select(Entry).where(Entry.user_id == 1)).scalars().all()
+    session.commit()
+    return session, legacy_generate_all_entries(entries, user.birth, user.exp_years)
+
+
+def projection_render(user: User):
+    rows = db.session.execute(
+        select(Entry.id, Entry.start).where(Entry.user_id == 1)
+    ).all()
+    return generate_week_grid(rows, user.birth, user.exp_years)
+
+
+def held_memory(render, renders: int) -> tuple[int, int]:
+    # Bytes still held and peak bytes with every render kept alive until the
+    # last one is done
+    tracemalloc.start()
+    held = [render() for _ in range(renders)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current, peak
+
+
+def report(label: str, current: int, peak: int, renders: int):
+    print(f"{label:<30} {current / renders / 1024:12.1f} {peak / 1024:10.0f}")
+
+
+def main(renders: int = 100, budget_kib: float = 48.0) -> int:
+    app = load_app()
+    with app.app_context():
+        user = populate()
+        weeks = len(projection_render(user))
+        print(f"{renders} renders of {weeks} weeks")
+        print(f"{'':<30} {'held KiB each':>12} {'peak KiB':>10}")
+        report(
+            "ORM entries, list of tuples",
+            *held_memory(lambda: orm_render(user), renders),
+            renders,
+        )
+        held, peak = held_memory(lambda: projection_render(user), renders)
+        report("(id, start) rows, WeekGrid", held, peak, renders)
+    user_cache.backend = NullCache()
+    client = logged_in_client(app)
+    client.get("/api/grid")
+    tracemalloc.start()
+    with ThreadPoolExecutor(renders) as pool:
+        statuses = list(
+            pool.map(lambda _: client.get("/api/grid").status_code, range(renders))
+        )
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert statuses == [200] * renders, statuses
+    print(f"{'GET /api/grid, concurrent':<30} {'':>12} {peak / 1024:10.0f}")
+    per_render = held / renders / 1024
+    print(
+        f"WeekGrid held per render: {per_render:.1f} KiB (budget {budget_kib:.0f} KiB)"
+    )
+    return 0 if per_render <= budget_kib else 1
+
+
+if __name__ == "__main__":
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    budget_kib = float(sys.argv[2]) if len(sys.argv) > 2 else 48.0
+    sys.exit(main(renders, budget_kib))
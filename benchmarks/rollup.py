@@ -0,0 +1,140 @@
+"""The month, year and decade views of a 120 year grid with an entry in most
+past weeks: summarised by expanding every week of the grid in Python, as the
+week view does, vs rollup.get_rollup() from tag_stats and the occupancy
+bitmap. Checks both give the same cells.
+
+Run from the repo root: python -m benchmarks.rollup [repeats]
+"""
+
+import datetime
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import insert, select, update
+
+from benchmarks.common import load_app
+from grid import grid_bounds, grid_start
+from models import db, entry_tag, Entry, Tag, User
+from occupancy import get_occupancy, rebuild_occupancy
+from rollup import bucket_start, get_rollup
+from stats import rebuild_tag_stats
+
+EXP_YEARS = 120
+N_TAGS = 8
+
+
+def populate() -> User:
+    user = db.session.get(User, 1)
+    user.birth = datetime.date.today() - datetime.timedelta(days=100 * 365)
+    user.exp_years = EXP_YEARS
+    db.session.execute(update(Tag).where(Tag.user_id == 1).values(color="#0000ff"))
+    tag_ids = (
+        db.session.execute(
+            insert(Tag).returning(Tag.id),
+            [
+                {"user_id": 1, "name": f"Bench {t}", "color": "#ff0000"}
+                for t in range(N_TAGS)
+            ],
+        )
+        .scalars()
+        .all()
+    )
+    db.session.execute(db.delete(entry_tag))
+    db.session.execute(db.delete(Entry))
+    start = grid_start(user.birth)
+    rng = random.Random(0)
+    weeks = [
+        w
+        for w in range((datetime.date.today() - start).days // 7)
+        if rng.random() < 0.8
+    ]
+    entry_ids = (
+        db.session.execute(
+            insert(Entry).returning(Entry.id),
+            [
+                {"user_id": 1, "start": start + datetime.timedelta(weeks=w)}
+                for w in weeks
+            ],
+        )
+        .scalars()
+        .all()
+    )
+    db.session.execute(
+        insert(entry_tag),
+        [
+            {"entry_id": entry_id, "tag_id": tag_id}
+            for entry_id in entry_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 2))
+        ],
+    )
+    rebuild_tag_stats(db.session, 1)
+    rebuild_occupancy(db.session, 1)
+    db.session.commit()
+    return user
+
+
+def expanded(user: User, zoom: str) -> list[list]:
+    # Every entry and its tags read back, and every week of the grid visited
+    tags = defaultdict(list)
+    for start, tag_id in db.session.execute(
+        select(Entry.start, entry_tag.c.tag_id)
+        .join(entry_tag, entry_tag.c.entry_id == Entry.id)
+        .where(Entry.user_id == user.id)
+    ):
+        tags[start].append(tag_id)
+    start, n_weeks, past_weeks = grid_bounds(user.birth, user.exp_years)
+    cells = {}
+    for i in range(n_weeks):
+        d = start + datetime.timedelta(weeks=i)
+        cell = cells.setdefault(bucket_start(d, zoom), [0, 0, 0, Counter()])
+        cell[0] += 1
+        cell[1] += i < past_weeks
+        if d in tags:
+            cell[2] += 1
+            cell[3].update(tags[d])
+    return [
+        [
+            bucket.isoformat(),
+            weeks,
+            past,
+            filled,
+            min(counts, key=lambda t: (-counts[t], t)) if counts else None,
+        ]
+        for bucket, (weeks, past, filled, counts) in cells.items()
+    ]
+
+
+def median_ms(f, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        f()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(repeats: int = 20):
+    app = load_app()
+    with app.app_context():
+        user = populate()
+        print(f"{'zoom':<8} {'cells':>6} {'expanded ms':>12} {'rollup ms':>10}")
+        for zoom in ("month", "year", "decade"):
+
+            def rollup():
+                return get_rollup(
+                    user.id, user.birth, user.exp_years, get_occupancy(user.id), zoom
+                )["cells"]
+
+            cells = rollup()
+            assert cells == expanded(user, zoom)
+            print(
+                f"{zoom:<8} {len(cells):>6} {median_ms(lambda: expanded(user, zoom), repeats):>12.2f}"
+                f" {median_ms(rollup, repeats):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
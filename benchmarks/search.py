@@ -0,0 +1,83 @@
+"""Search latency as the number of indexed notes grows: one user searching
+among other users' notes, for the first page and a page deep in the results.
+
+Run from the repo root: python -m benchmarks.search [requests]
+"""
+
+import datetime
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import load_app, logged_in_client
+from migrations import upgrade_db
+from models import db, Entry, User
+from search import rebuild_search_index
+
+WORDS = (
+    "walk run swim climb read write cook travel visit meet work study paint "
+    "garden sleep rest holiday family friends city beach mountain river forest"
+).split()
+NOTES_PER_USER = 2000
+
+
+def add_users(app, rng: random.Random, first: int, n: int):
+    start = datetime.date(1950, 1, 2)
+    with app.app_context():
+        for u in range(first, first + n):
+            user_id = db.session.execute(
+                insert(User)
+                .values(oauth_id=f"search_{u}", birth=start, exp_years=80)
+                .returning(User.id)
+            ).scalar_one()
+            db.session.execute(
+                insert(Entry),
+                [
+                    {
+                        "user_id": user_id,
+                        "start": start + datetime.timedelta(weeks=w),
+                        "note": " ".join(rng.choices(WORDS, k=12)),
+                    }
+                    for w in range(NOTES_PER_USER)
+                ],
+            )
+        rebuild_search_index(db.session)
+        db.session.commit()
+
+
+def median_ms(client, path: str, requests: int) -> float:
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(samples)
+
+
+def main(requests: int = 50):
+    app = load_app(seed_test_user=False)
+    upgrade_db(app)
+    rng = random.Random(0)
+    add_users(app, rng, 0, 1)
+    client = logged_in_client(app, user_id=1)
+    print(f"{'notes':>7} {'first page ms':>14} {'page 10 ms':>11}")
+    users = 1
+    for target in (1, 5, 25):
+        add_users(app, rng, users, target - users)
+        users = target
+        after = None
+        for _ in range(9):
+            after = client.get(f"/api/search?q=beach&after={after or ''}").json["next"]
+        print(
+            f"{users * NOTES_PER_USER:>7}"
+            f" {median_ms(client, '/api/search?q=beach', requests):14.2f}"
+            f" {median_ms(client, f'/api/search?q=beach&after={after}', requests):11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
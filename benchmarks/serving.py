@@ -0,0 +1,114 @@
+"""Concurrent sign-in throughput of gunicorn with sync vs gevent workers. Each
+client runs the full OAuth flow against a stub provider that takes --delay
+seconds per call, then loads the page it lands on, so the workload is mostly
+waiting on I/O as sign-ins on a small machine are.
+
+Run from the repo root, e.g.:
+    python -m benchmarks.serving --clients 50 --seconds 10 --delay 0.2
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import load_app
+from migrations import upgrade_db
+from oauth_stub import start_stub_server, stub_app
+
+
+def wait_until_up(url: str, seconds: float = 20.0):
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def sign_in(base_url: str, login: str) -> float:
+    started = time.perf_counter()
+    with requests.Session() as session:
+        response = session.get(
+            f"{base_url}/authorize/stub", params={"login_hint": login}, timeout=60
+        )
+    assert response.status_code == 200, response.status_code
+    assert "/authorize/" not in response.url, response.url
+    return time.perf_counter() - started
+
+
+def run_load(base_url: str, clients: int, seconds: float) -> list[float]:
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(n: int):
+        while time.perf_counter() < deadline:
+            elapsed = sign_in(base_url, f"bench{n}")
+            with lock:
+                latencies.append(elapsed)
+
+    with ThreadPoolExecutor(clients) as pool:
+        for f in [pool.submit(client, n) for n in range(clients)]:
+            f.result()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--delay", type=float, default=0.2, help="per OAuth call")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    upgrade_db(load_app(database_url=args.database_url, seed_test_user=False))
+    stub_app.config["STUB_DELAY"] = args.delay
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    stub_url = start_stub_server()
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(
+        f"{args.clients} clients, {args.workers} workers, {args.delay}s per OAuth call",
+        file=sys.stderr,
+    )
+    for worker_class in ("sync", "gevent"):
+        env = {
+            **os.environ,
+            "OAUTH2_STUB": stub_url,
+            "PORT": str(args.port),
+            "WORKER_CLASS": worker_class,
+            "WEB_CONCURRENCY": str(args.workers),
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app:create_app()"],
+            env=env,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up(base_url + "/login")
+            # Creates the users, so the measured run only signs them back in
+            run_load(base_url, args.clients, 0.1)
+            latencies = sorted(run_load(base_url, args.clients, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(
+            f"{worker_class:<7} {len(latencies) / args.seconds:8.1f} sign-ins/s"
+            f"  p50 {cuts[49] * 1000:7.0f} ms  p95 {cuts[94] * 1000:7.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Cold start time: from the first import of the app to its first response,
+each run in a fresh interpreter.
+
+Run from the repo root: python -m benchmarks.startup [runs] [target_ms]
+Exits with status 1 if the median is over the target.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+response = app.test_client().get("/")
+assert response.status_code == 200, response.status_code
+elapsed = time.perf_counter() - started
+import sys
+print(elapsed, "requests" in sys.modules)
+"""
+
+
+def main(runs: int = 5, target_ms: float = 1000.0) -> int:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="lifecal-bench-"), "bench.db")
+    env = {
+        **os.environ,
+        "LIFECAL_ENV": "FLY",
+        "FLASK_SECRET_KEY": "benchmark",
+        "DATABASE_URL": f"sqlite:///{db_path}",
+    }
+    env.pop("INIT_DB", None)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        timings.append(float(output[0]) * 1000)
+        requests_loaded = output[1] == "True"
+    median = statistics.median(timings)
+    print(
+        f"import to first response: median {median:.0f} ms, min {min(timings):.0f} ms,"
+        f" max {max(timings):.0f} ms over {runs} runs (target {target_ms:.0f} ms)"
+    )
+    print(f"requests imported at startup: {requests_loaded}")
+    return 0 if median <= target_ms else 1
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    target_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1000.0
+    sys.exit(main(runs, target_ms))
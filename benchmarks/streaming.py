@@ -0,0 +1,89 @@
+"""Time to first byte, total time and peak memory of GET /: streamed with
+stream_template vs rendered into one string first, for a 120 year grid.
+
+Run from the repo root: python -m benchmarks.streaming [requests]
+"""
+
+import datetime
+import statistics
+import sys
+import time
+import tracemalloc
+
+from flask import render_template
+from flask_login import current_user
+from sqlalchemy import insert, update
+
+from app import current_grid_key, iter_grid_payload
+from benchmarks.common import load_app, logged_in_client
+from cache import NullCache, SimpleCache, user_cache
+from grid import grid_start
+from models import db, Entry, User
+from rollup import ZOOMS
+
+EXP_YEARS = 120
+
+
+def buffered_index():
+    # GET / as it was before streaming: the whole document in one string
+    return render_template(
+        "index.html",
+        birth_readable=current_user.birth.strftime("%d %B, %Y"),
+        exp_years=current_user.exp_years,
+        zoom="week",
+        zooms=ZOOMS,
+        grid_payload=["".join(iter_grid_payload(current_grid_key()))],
+    )
+
+
+def measure(client, path: str) -> tuple[float, float, int]:
+    # Returns ms to the first body chunk, ms to the last and peak bytes
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(path, buffered=False)
+    chunks = iter(response.response)
+    next(chunks)
+    first = time.perf_counter() - started
+    for _ in chunks:
+        pass
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    response.close()
+    assert response.status_code == 200, response.status_code
+    return first * 1000, total * 1000, peak
+
+
+def main(requests: int = 50):
+    app = load_app()
+    app.add_url_rule("/buffered", "buffered_index", buffered_index)
+    with app.app_context():
+        user = db.session.get(User, 1)
+        start = grid_start(user.birth)
+        weeks_lived = (datetime.date.today() - start).days // 7
+        db.session.execute(update(User).where(User.id == 1).values(exp_years=EXP_YEARS))
+        db.session.execute(
+            insert(Entry).prefix_with("OR IGNORE"),
+            [
+                {"user_id": 1, "start": start + datetime.timedelta(weeks=w)}
+                for w in range(0, weeks_lived, 2)
+            ],
+        )
+        db.session.commit()
+    client = logged_in_client(app)
+    print(f"{'':<22} {'TTFB ms':>8} {'total ms':>9} {'peak KiB':>9}")
+    for backend in (NullCache, SimpleCache):
+        for path in ("/buffered", "/"):
+            user_cache.backend = backend()
+            user_cache.bump(1)
+            samples = [measure(client, path) for _ in range(requests)]
+            print(
+                f"{path:<10} {backend.__name__:<11}"
+                f" {statistics.median(s[0] for s in samples):8.2f}"
+                f" {statistics.median(s[1] for s in samples):9.2f}"
+                f" {statistics.median(s[2] for s in samples) / 1024:9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,238 @@
+"""Load/benchmark suite: seeds a synthetic population, drives the real routes
+through the Flask test client as signed-in users and reports latency
+percentiles, SQL statements per request and peak memory per route as JSON.
+
+Run from the repo root, e.g.:
+    python -m benchmarks.suite --users 20 --entries 500 --output run.json
+Pass --database-url to run against Postgres instead of a temporary SQLite file.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import sqlalchemy
+from flask import g
+from sqlalchemy import insert
+
+from benchmarks.common import load_app
+from migrations import upgrade_db
+from models import db, entry_tag, Entry, Tag, User
+from stats import rebuild_tag_stats
+
+
+def populate(app, rng: random.Random, args) -> dict[int, list[int]]:
+    # Bulk inserts a population and returns entry ids by user id
+    today = datetime.date.today()
+    entry_ids = {}
+    with app.app_context():
+        for u in range(args.users):
+            birth = today - datetime.timedelta(
+                days=rng.randint(20 * 365, min(args.exp_years, 90) * 365)
+            )
+            user_id = db.session.execute(
+                insert(User)
+                .values(oauth_id=f"bench_{u}", birth=birth, exp_years=args.exp_years)
+                .returning(User.id)
+            ).scalar_one()
+            tag_ids = (
+                db.session.execute(
+                    insert(Tag).returning(Tag.id),
+                    [
+                        {"user_id": user_id, "name": f"tag {t}", "color": "#0000ff"}
+                        for t in range(args.tag_pool)
+                    ],
+                )
+                .scalars()
+                .all()
+            )
+            first_monday = birth - datetime.timedelta(days=birth.weekday())
+            weeks_lived = (today - first_monday).days // 7
+            weeks = sorted(
+                rng.sample(range(weeks_lived), min(args.entries, weeks_lived))
+            )
+            ids = (
+                db.session.execute(
+                    insert(Entry).returning(Entry.id),
+                    [
+                        {
+                            "user_id": user_id,
+                            "start": first_monday + datetime.timedelta(weeks=w),
+                            "note": f"Synthetic note for week {w}",
+                        }
+                        for w in weeks
+                    ],
+                )
+                .scalars()
+                .all()
+            )
+            links = [
+                {"entry_id": e, "tag_id": t}
+                for e in ids
+                for t in rng.sample(tag_ids, min(args.tags_per_entry, len(tag_ids)))
+            ]
+            if links:
+                db.session.execute(insert(entry_tag), links)
+            db.session.commit()
+            entry_ids[user_id] = ids
+        rebuild_tag_stats(db.session)
+        db.session.commit()
+    return entry_ids
+
+
+def percentiles(samples: list[float]) -> dict:
+    if len(samples) < 2:
+        samples = samples * 2
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def run(args) -> dict:
+    app = load_app(
+        database_url=args.database_url, seed_test_user=False, CACHE_TYPE=args.cache
+    )
+    upgrade_db(app)
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    entry_ids = populate(app, rng, args)
+    seed_seconds = time.perf_counter() - started
+
+    request_globals = []
+
+    @app.after_request
+    def record_request_globals(response):
+        # Streamed responses run more statements after this, so they are
+        # counted once the body has been read
+        request_globals.append(g._get_current_object())
+        return response
+
+    client = app.test_client()
+    user_ids = list(entry_ids)
+    today = datetime.date.today()
+    next_week = today + datetime.timedelta(days=7 - today.weekday())
+
+    def request_for(route: str, user_id: int):
+        if route == "GET /entry/<id>/edit":
+            entry_id = rng.choice(entry_ids[user_id])
+            return "GET", f"/entry/{entry_id}/edit", None
+        if route == "POST /entry/add":
+            start = next_week + datetime.timedelta(weeks=rng.randrange(52 * 5))
+            data = {"start": start.isoformat(), "tags[]": ["tag 0"], "note": "new"}
+            return "POST", "/entry/add", data
+        method, path = route.split(" ")
+        return method, path, None
+
+    def timed_request(route: str) -> tuple[float, int]:
+        user_id = rng.choice(user_ids)
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+            session.pop("_flashes", None)
+        method, path, data = request_for(route, user_id)
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        elapsed = (time.perf_counter() - request_started) * 1000
+        assert response.status_code in (200, 302), (route, response.status_code)
+        return elapsed, request_globals[-1].get("sql_query_count", 0)
+
+    results = {}
+    for route in args.routes:
+        for _ in range(args.warmup):
+            timed_request(route)
+        latencies, queries = [], []
+        for _ in range(args.requests):
+            elapsed, count = timed_request(route)
+            latencies.append(elapsed)
+            queries.append(count)
+        # Memory is measured in a separate pass, as tracemalloc slows requests
+        tracemalloc.start()
+        peak = 0
+        for _ in range(max(args.requests // 10, 1)):
+            tracemalloc.reset_peak()
+            timed_request(route)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        results[route] = {
+            **percentiles(latencies),
+            "requests": args.requests,
+            "queries_per_request": round(statistics.fmean(queries), 2),
+            "max_queries": max(queries),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+        print(
+            f"{route:<22} p50 {results[route]['p50_ms']:8.2f} ms"
+            f"  p95 {results[route]['p95_ms']:8.2f} ms"
+            f"  p99 {results[route]['p99_ms']:8.2f} ms"
+            f"  {results[route]['queries_per_request']:5.1f} queries"
+            f"  {results[route]['peak_memory_kb']:8.1f} KiB",
+            file=sys.stderr,
+        )
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            k: v for k, v in vars(args).items() if k not in ("output", "database_url")
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "database": dialect,
+            "platform": platform.platform(),
+        },
+        "seed_seconds": round(seed_seconds, 3),
+        "routes": results,
+    }
+
+
+ROUTES = [
+    "GET /",
+    "GET /api/grid",
+    "GET /entry/add",
+    "GET /entry/<id>/edit",
+    "GET /tags",
+    "GET /settings",
+    "GET /stats",
+    "POST /entry/add",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--entries", type=int, default=200, help="entries per user")
+    parser.add_argument("--tags-per-entry", type=int, default=2)
+    parser.add_argument("--tag-pool", type=int, default=10, help="tags per user")
+    parser.add_argument("--exp-years", type=int, default=80)
+    parser.add_argument("--requests", type=int, default=200, help="per route")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", default="simple", choices=["simple", "null"])
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--output", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
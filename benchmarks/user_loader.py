@@ -0,0 +1,25 @@
+"""Requests per second with and without the cached user loader.
+
+Run from the repo root: python -m benchmarks.user_loader
+"""
+
+from benchmarks.common import load_app, logged_in_client, requests_per_second
+from cache import NullCache, SimpleCache, user_cache
+
+
+def main():
+    app = load_app()
+    client = logged_in_client(app)
+    for path in ("/", "/settings"):
+        user_cache.backend = NullCache()
+        uncached = requests_per_second(client, path)
+        user_cache.backend = SimpleCache()
+        cached = requests_per_second(client, path)
+        print(
+            f"GET {path:<10} uncached {uncached:8.0f} req/s"
+            f"  cached {cached:8.0f} req/s  ({cached / uncached:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
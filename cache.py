@@ -0,0 +1,207 @@
+import datetime
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from flask_login import UserMixin
+
+
+class SimpleCache:
+    """In-process LRU cache, bounded by number of entries. Timeouts are in
+    seconds and 0 means no expiry."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires and expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: int = 0):
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class FileSystemCache:
+    """Cache stored as files in a shared directory, so that all gunicorn
+    workers on a machine see the same entries. Least recently written files
+    are pruned once there are more than max_entries."""
+
+    def __init__(self, cache_dir: str, max_entries: int = 512):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._path(key), "rb") as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires <= time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, timeout: int = 0):
+        expires = time.time() + timeout if timeout else 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        # Atomic rename, so readers never see a partially written file
+        os.replace(tmp_path, self._path(key))
+        self._prune()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _prune(self):
+        with os.scandir(self.cache_dir) as it:
+            files = [e for e in it if e.is_file() and not e.name.endswith(".tmp")]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda e: e.stat().st_mtime)
+        for e in files[: len(files) - self.max_entries]:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+
+class NullCache:
+    """Caches nothing, for benchmarks and debugging."""
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, timeout: int = 0):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+
+def seconds_until_next_monday(now: Optional[datetime.datetime] = None) -> int:
+    if now is None:
+        now = datetime.datetime.now()
+    next_monday = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=7 - now.weekday()), datetime.time()
+    )
+    return max(int((next_monday - now).total_seconds()), 1)
+
+
+class SessionUser(UserMixin):
+    """The fields of User that requests need, rebuilt from the cache without
+    touching the database. Relationships are deliberately not available."""
+
+    __slots__ = ("id", "birth", "exp_years")
+
+    def __init__(self, id: int, birth: datetime.date, exp_years: int):
+        self.id = id
+        self.birth = birth
+        self.exp_years = exp_years
+
+
+class UserCache:
+    """Per-user cache. Each user has a version that the write routes bump;
+    everything cached for a user is keyed on that version. Grid payloads also
+    expire at the next Monday, when the past/future boundary moves."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.user_timeout = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Shared by every process on the machine, gunicorn workers and the job
+        # worker included, as user versions are bumped by whichever one writes
+        app.config.setdefault("CACHE_TYPE", "filesystem")
+        app.config.setdefault("CACHE_DIR", None)
+        app.config.setdefault("CACHE_MAX_ENTRIES", 1024)
+        app.config.setdefault("USER_CACHE_TIMEOUT", 300)
+        cache_type = app.config["CACHE_TYPE"]
+        max_entries = int(app.config["CACHE_MAX_ENTRIES"])
+        if cache_type == "simple":
+            self.backend = SimpleCache(max_entries)
+        elif cache_type == "filesystem":
+            # One directory per database, as user ids and versions mean
+            # nothing across databases
+            database = app.config.get("SQLALCHEMY_DATABASE_URI") or ""
+            cache_dir = app.config["CACHE_DIR"] or os.path.join(
+                tempfile.gettempdir(),
+                "lifecal-cache-" + hashlib.sha1(database.encode()).hexdigest()[:12],
+            )
+            self.backend = FileSystemCache(cache_dir, max_entries)
+        elif cache_type == "null":
+            self.backend = NullCache()
+        else:  # Any object with get/set/delete, e.g. a shared cache client
+            self.backend = cache_type
+        self.user_timeout = int(app.config["USER_CACHE_TIMEOUT"])
+        app.extensions["user_cache"] = self
+
+    def version(self, user_id: int) -> str:
+        version = self.backend.get(f"version:{user_id}")
+        if version is None:
+            # Never reuse an old version if the version key itself was evicted
+            version = self.bump(user_id)
+        return version
+
+    def bump(self, user_id: int) -> str:
+        version = str(time.time_ns())
+        self.backend.set(f"version:{user_id}", version)
+        return version
+
+    def grid_key(self, user_id: int, week: datetime.date) -> str:
+        # Read the version before the grid is built, so a write that lands
+        # mid-render can only ever leave a stale grid under the old version
+        return f"grid:{user_id}:{self.version(user_id)}:{week.isoformat()}"
+
+    def get(self, key: str) -> Optional[str]:
+        return self.backend.get(key)
+
+    def set(self, key: str, payload: str):
+        self.backend.set(key, payload, timeout=seconds_until_next_monday())
+
+    def get_user(self, user_id: int) -> Optional[SessionUser]:
+        fields = self.backend.get(f"user:{user_id}:{self.version(user_id)}")
+        return SessionUser(*fields) if fields is not None else None
+
+    def set_user(self, user) -> SessionUser:
+        fields = (user.id, user.birth, user.exp_years)
+        self.backend.set(
+            f"user:{user.id}:{self.version(user.id)}", fields, self.user_timeout
+        )
+        return SessionUser(*fields)
+
+
+user_cache = UserCache()
@@ -0,0 +1,196 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import func, insert, select, union_all, update
+
+from models import db, entry_tag, Entry, Tag, Tombstone, User
+
+CHANGES_PAGE_SIZE = 500
+
+# Each write to a user's data takes the next value of users.revision and
+# stamps it on the entries and tags it changed, on tombstones of the ones it
+# deleted, and on users.settings_revision for settings. Taking a revision
+# locks the user row until commit, so a user's revisions become visible in
+# order and a client that has seen everything up to revision n only ever
+# needs rows stamped above n, found through the (user_id, revision) indexes.
+# Rows created without a revision (e.g. tags made by get_or_create_tags())
+# are stamped by the next revision of the same transaction.
+
+
+def create_tombstones_table(conn):
+    # From the model, for the dialect's auto-incrementing primary key
+    Tombstone.__table__.create(conn, checkfirst=True)
+
+
+def next_revision(user_id: int) -> int:
+    return db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(revision=User.revision + 1)
+        .returning(User.revision)
+    ).scalar_one()
+
+
+def stamp(
+    model: db.Model,
+    kind: str,
+    user_id: int,
+    revision: int,
+    changed: Iterable[int],
+    deleted: Iterable[int],
+):
+    changed, deleted = list(changed), list(deleted)
+    condition = (model.user_id == user_id) & model.revision.is_(None)
+    if changed:
+        condition |= model.id.in_(changed)
+    db.session.execute(
+        update(model)
+        .where(condition)
+        .values(revision=revision, updated=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    if deleted:
+        db.session.execute(
+            insert(Tombstone),
+            [
+                {"user_id": user_id, "kind": kind, "object_id": i, "revision": revision}
+                for i in deleted
+            ],
+        )
+
+
+def entries_revised(user_id: int, existing: Iterable[int], deleted: Iterable[int]):
+    # Records entries written or deleted, after the write
+    revision = next_revision(user_id)
+    stamp(Entry, "entry", user_id, revision, existing, deleted)
+    stamp(Tag, "tag", user_id, revision, (), ())
+
+
+def tags_revised(user_id: int, tag_ids: Iterable[int]):
+    # Records tags added, edited or deleted, after the write
+    tag_ids = set(tag_ids)
+    existing = set(
+        db.session.execute(
+            select(Tag.id).where((Tag.user_id == user_id) & Tag.id.in_(tag_ids))
+        ).scalars()
+    )
+    stamp(Tag, "tag", user_id, next_revision(user_id), existing, tag_ids - existing)
+
+
+def settings_revised(user_id: int):
+    revision = next_revision(user_id)
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(settings_revision=revision)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def page_end(user_id: int, since: int, limit: int) -> Optional[int]:
+    # The highest revision whose changes, together with those of every
+    # revision before it, fit in limit rows; at least one revision is always
+    # included whatever its size. None if everything after since fits.
+    revisions = union_all(
+        *(
+            select(model.revision.label("revision")).where(
+                (model.user_id == user_id) & (model.revision > since)
+            )
+            for model in (Entry, Tag, Tombstone)
+        )
+    ).subquery()
+    total = 0
+    last = None
+    for revision, n in db.session.execute(
+        select(revisions.c.revision, func.count())
+        .group_by(revisions.c.revision)
+        .order_by(revisions.c.revision)
+        .limit(limit + 1)
+    ):
+        if total and total + n > limit:
+            return last
+        total += n
+        last = revision
+    return None
+
+
+def get_changes(
+    user_id: int, since: Optional[int] = None, limit: int = CHANGES_PAGE_SIZE
+) -> dict:
+    """Everything that changed after revision since, or the whole state if
+    since is None, with the cursor to pass as since next time. Large deltas
+    are split at revision boundaries, with more set until the client has
+    caught up."""
+    user = db.session.execute(
+        select(User.revision, User.settings_revision, User.birth, User.exp_years).where(
+            User.id == user_id
+        )
+    ).one()
+    upto = None if since is None else page_end(user_id, since, limit)
+    cursor = user.revision if upto is None else upto
+
+    def window(model: db.Model):
+        condition = model.user_id == user_id
+        if since is not None:
+            condition &= (model.revision > since) & (model.revision <= cursor)
+        return condition
+
+    entry_tags = {}
+    for entry_id, tag_id in db.session.execute(
+        select(entry_tag.c.entry_id, entry_tag.c.tag_id).where(
+            entry_tag.c.entry_id.in_(select(Entry.id).where(window(Entry)))
+        )
+    ):
+        entry_tags.setdefault(entry_id, []).append(tag_id)
+    changes = {
+        "cursor": cursor,
+        "more": upto is not None,
+        "settings": None,
+        "entries": [
+            {
+                "id": e.id,
+                "start": e.start.isoformat(),
+                "note": e.note,
+                "tags": entry_tags.get(e.id, []),
+                "updated": e.updated.isoformat() if e.updated else None,
+            }
+            for e in db.session.execute(
+                select(Entry.id, Entry.start, Entry.note, Entry.updated)
+                .where(window(Entry))
+                .order_by(Entry.id)
+            )
+        ],
+        "tags": [
+            {
+                "id": t.id,
+                "name": t.name,
+                "color": t.color,
+                "updated": t.updated.isoformat() if t.updated else None,
+            }
+            for t in db.session.execute(
+                select(Tag.id, Tag.name, Tag.color, Tag.updated)
+                .where(window(Tag))
+                .order_by(Tag.id)
+            )
+        ],
+        "deleted": {"entries": [], "tags": []},
+    }
+    if since is None or since < user.settings_revision <= cursor:
+        changes["settings"] = {
+            "birth": user.birth.isoformat(),
+            "exp_years": user.exp_years,
+        }
+    if since is not None:
+        # SQLite can reuse the id of a deleted row, and a row that exists now
+        # outdates any tombstone with its id
+        current = {
+            key: {row["id"] for row in changes[key]} for key in ("entries", "tags")
+        }
+        for kind, object_id in db.session.execute(
+            select(Tombstone.kind, Tombstone.object_id)
+            .where(window(Tombstone))
+            .order_by(Tombstone.revision)
+        ):
+            key = "entries" if kind == "entry" else "tags"
+            if object_id not in current[key]:
+                changes["deleted"][key].append(object_id)
+    return changes
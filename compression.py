@@ -0,0 +1,103 @@
+import gzip
+import zlib
+from functools import partial
+from typing import Iterable, Iterator
+
+import brotli
+from flask import current_app, request
+
+COMPRESSED_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "image/svg+xml",
+    "text/css",
+    "text/csv",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+# Levels that keep compressing a grid page to a few milliseconds; static files
+# are compressed at the highest levels once, by assets.build_assets()
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+# Input bytes after which a streamed response is flushed to the client
+STREAM_FLUSH_BYTES = 16 * 1024
+
+
+def compress_stream(body: Iterable, encoding: str) -> Iterator[bytes]:
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush = compressor.process, compressor.flush
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, wbits=31)
+        process, finish = compressor.compress, compressor.flush
+        flush = partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+    pending = 0
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            out = process(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_BYTES:
+                # Sent now, so the client can render the page as it arrives
+                out += flush()
+                pending = 0
+            if out:
+                yield out
+        yield finish()
+    finally:
+        # Lets a stream_with_context() body tear down its request context
+        if hasattr(body, "close"):
+            body.close()
+
+
+class Compression:
+    """Compresses text responses of COMPRESS_MIN_SIZE bytes or more with
+    Brotli or gzip, whichever the client prefers. Streamed responses are
+    compressed as they stream, flushed every STREAM_FLUSH_BYTES. Strong ETags
+    become weak, as the compressed body differs byte for byte but not in
+    meaning, which keeps If-None-Match working for either encoding."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.after_request(self._after_request)
+        app.extensions["compression"] = self
+
+    def _after_request(self, response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.mimetype not in COMPRESSED_MIMETYPES
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(("br", "gzip"))
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < int(current_app.config["COMPRESS_MIN_SIZE"]):
+                return response
+            if encoding == "br":
+                response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+            else:
+                response.set_data(gzip.compress(data, GZIP_LEVEL, mtime=0))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compression = Compression()
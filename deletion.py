@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select, update
+
+from jobs import enqueue, job_handler
+from models import db, entry_tag, Entry, Job, Tag, TagStat, Tombstone, User
+from search import delete_entry_index, delete_user_index
+
+# Accounts with more entries are deleted by a job, in chunks of DELETE_CHUNK
+# entries, each in its own short transaction
+SYNC_DELETE_MAX_ENTRIES = 2000
+DELETE_CHUNK = 1000
+
+
+def delete_tag_rows(conn, tag_id: int):
+    # Unlinks the tag from its entries with one statement instead of loading
+    # Tag.entries; the caller keeps stats and the search index in step
+    conn.execute(delete(entry_tag).where(entry_tag.c.tag_id == tag_id))
+    conn.execute(delete(Tag).where(Tag.id == tag_id))
+
+
+def delete_user_rows(conn, user_id: int):
+    """Deletes the user and everything they own with one statement per table,
+    in the caller's transaction. Nothing is left to ON DELETE CASCADE, as
+    SQLite does not enforce foreign keys."""
+    user_entries = select(Entry.id).where(Entry.user_id == user_id)
+    conn.execute(delete(entry_tag).where(entry_tag.c.entry_id.in_(user_entries)))
+    delete_user_index(conn, user_id)
+    conn.execute(delete(TagStat).where(TagStat.user_id == user_id))
+    conn.execute(delete(Tombstone).where(Tombstone.user_id == user_id))
+    conn.execute(delete(Job).where(Job.user_id == user_id))
+    conn.execute(delete(Entry).where(Entry.user_id == user_id))
+    conn.execute(delete(Tag).where(Tag.user_id == user_id))
+    conn.execute(delete(User).where(User.id == user_id))
+
+
+def delete_entries_chunk(conn, user_id: int, chunk: int = DELETE_CHUNK) -> int:
+    # Deletes up to chunk of the user's entries with their tag links and
+    # index rows, returning how many went
+    entry_ids = (
+        conn.execute(
+            select(Entry.id)
+            .where(Entry.user_id == user_id)
+            .order_by(Entry.id)
+            .limit(chunk)
+        )
+        .scalars()
+        .all()
+    )
+    if entry_ids:
+        conn.execute(delete(entry_tag).where(entry_tag.c.entry_id.in_(entry_ids)))
+        delete_entry_index(conn, entry_ids)
+        conn.execute(delete(Entry).where(Entry.id.in_(entry_ids)))
+    return len(entry_ids)
+
+
+@job_handler("purge_user")
+def purge_user(user_id: int, chunk: int = DELETE_CHUNK):
+    # Finishes deleting an account marked deleted, committing after each
+    # chunk, so it can be resumed after a restart. An unmarked user is left
+    # alone, as SQLite may have given the id to a new account since.
+    marked = db.session.execute(
+        select(User.id).where((User.id == user_id) & User.deleted_at.is_not(None))
+    ).first()
+    if marked is None:
+        return
+    while delete_entries_chunk(db.session, user_id, chunk):
+        db.session.commit()
+    delete_user_rows(db.session, user_id)
+    db.session.commit()
+
+
+def delete_account(user_id: int) -> bool:
+    """Deletes the account right away if it is small. Otherwise it is marked
+    deleted, which signs it out everywhere and frees its OAuth id for a new
+    account, and a job is queued to purge its rows. Returns whether the
+    deletion is complete. `flask --app app purge-deleted-users` finishes
+    accounts whose job failed."""
+    n_entries = db.session.execute(
+        select(func.count()).select_from(Entry).where(Entry.user_id == user_id)
+    ).scalar_one()
+    if n_entries <= SYNC_DELETE_MAX_ENTRIES:
+        delete_user_rows(db.session, user_id)
+        db.session.commit()
+        return True
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(oauth_id=f"deleted:{user_id}", deleted_at=datetime.now(timezone.utc))
+    )
+    # Not owned by the user, so that deleting their rows keeps the job
+    enqueue("purge_user", {"user_id": user_id})
+    db.session.commit()
+    return False
+
+
+def pending_deletions() -> list[int]:
+    return (
+        db.session.execute(select(User.id).where(User.deleted_at.is_not(None)))
+        .scalars()
+        .all()
+    )
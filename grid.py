@@ -0,0 +1,114 @@
+import datetime
+from array import array
+from datetime import date
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+# Per-week cell states stored in WeekGrid.states
+FUTURE = 0
+PAST = 1
+FILLED = 2
+
+WEEK = datetime.timedelta(weeks=1)
+
+
+class GridEntry(NamedTuple):
+    # What WeekGrid yields for a filled week, in place of an ORM entry
+    id: int
+    start: date
+
+
+def grid_start(birth: date) -> date:
+    return birth - datetime.timedelta(days=birth.weekday())
+
+
+def grid_end(start: date, exp_years: int) -> date:
+    if (
+        start.month == 2 and start.day == 29
+    ):  # If leap day but end year is not leap year
+        try:
+            return start.replace(year=start.year + exp_years)
+        except ValueError:
+            return start.replace(year=start.year + exp_years, month=3, day=1)
+    return start.replace(year=start.year + exp_years)
+
+
+class WeekGrid:
+    """One cell per week from the Monday of the birth week up to and including
+    the end date. Cell state is kept in a byte array, one byte per week, and
+    the ids of the entries of filled weeks in a parallel array in week order;
+    dates and entries are derived from the index on demand, so no date or
+    entry object is held per week."""
+
+    __slots__ = ("start", "n_weeks", "past_weeks", "states", "entry_ids")
+
+    def __init__(
+        self, start: date, n_weeks: int, past_weeks: int, entry_ids: dict[int, int]
+    ):
+        # entry_ids maps the index of each filled week to its entry id, which
+        # fits in 32 bits like the entries.id column
+        self.start = start
+        self.n_weeks = n_weeks
+        self.past_weeks = past_weeks
+        self.states = array("B", [PAST]) * past_weeks + array("B", [FUTURE]) * (
+            n_weeks - past_weeks
+        )
+        for i in entry_ids:
+            self.states[i] = FILLED
+        self.entry_ids = array("i", [entry_ids[i] for i in sorted(entry_ids)])
+
+    def __len__(self) -> int:
+        return self.n_weeks
+
+    def iter_filled_runs(self) -> Iterator[tuple[int, int]]:
+        # Run-length encoding of filled weeks as (first week index, length),
+        # read off the state array in order so nothing is sorted or collected
+        first = None
+        for i, state in enumerate(self.states):
+            if state == FILLED:
+                if first is None:
+                    first = i
+            elif first is not None:
+                yield first, i - first
+                first = None
+        if first is not None:
+            yield first, self.n_weeks - first
+
+    def __iter__(self) -> Iterator[tuple]:
+        # Same (date, is_past, entry) shape as the old list of tuples, with a
+        # GridEntry made as each filled week is reached
+        curr = self.start
+        states = self.states
+        entry_ids = iter(self.entry_ids)
+        past_weeks = self.past_weeks
+        for i in range(self.n_weeks):
+            entry = GridEntry(next(entry_ids), curr) if states[i] == FILLED else None
+            yield curr, i < past_weeks, entry
+            curr += WEEK
+
+
+def grid_bounds(
+    birth: date, exp_years: int, today: Optional[date] = None
+) -> tuple[date, int, int]:
+    # (first Monday, number of weeks, number of past weeks)
+    start = grid_start(birth)
+    end = grid_end(start, exp_years)
+    n_weeks = max((end - start).days // 7 + 1, 0)
+    if today is None:
+        today = datetime.datetime.now().date()
+    # Weeks whose Monday is strictly before today are in the past
+    past_weeks = min(max(-(-(today - start).days // 7), 0), n_weeks)
+    return start, n_weeks, past_weeks
+
+
+def generate_week_grid(
+    db_entries: Iterable, birth: date, exp_years: int, today: Optional[date] = None
+) -> WeekGrid:
+    # db_entries only need id and start, e.g. rows of select(Entry.id,
+    # Entry.start), and are not kept
+    start, n_weeks, past_weeks = grid_bounds(birth, exp_years, today)
+    entry_ids = {}
+    for e in db_entries:
+        days = (e.start - start).days
+        if days >= 0 and days % 7 == 0 and days // 7 < n_weeks:
+            entry_ids[days // 7] = e.id
+    return WeekGrid(start, n_weeks, past_weeks, entry_ids)
@@ -0,0 +1,50 @@
+"""Gunicorn settings, read by gunicorn from the working directory. The serving
+mode is picked with environment variables, so the Procfile stays the same:
+
+- WORKER_CLASS=sync (default): WEB_CONCURRENCY processes serving one request
+  each, so a request waiting on an OAuth provider or the database holds a whole
+  worker.
+- WORKER_CLASS=gevent: each process serves up to WORKER_CONNECTIONS requests
+  cooperatively, switching to another whenever one waits on a socket. Views
+  stay synchronous; gevent patches the standard library, requests included,
+  and psycogreen makes psycopg2 yield while Postgres works.
+
+Each worker also runs queued jobs in a background thread, so a deployment needs
+no separate worker process and jobs share the machine's cache; set RUN_JOBS=0
+to run `flask --app app run-jobs` on its own instead.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+worker_class = os.getenv("WORKER_CLASS", "sync")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "100"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "30"))
+run_jobs = os.getenv("RUN_JOBS", "1") != "0"
+
+
+def on_starting(server):
+    # Fingerprints and precompresses static files once per machine, before any
+    # worker loads the manifest; unchanged files are not compressed again
+    from assets import build_assets
+
+    build_assets(os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:  # No psycopg2, e.g. running locally on SQLite
+            return
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    # After the app has loaded and, for gevent, the standard library has been
+    # patched, so the thread is a greenlet there
+    if run_jobs:
+        from jobs import start_worker_thread
+
+        start_worker_thread(worker.wsgi)
@@ -0,0 +1,220 @@
+import datetime
+import threading
+import time
+from datetime import timezone
+from typing import Callable, Optional
+
+from flask import current_app
+from sqlalchemy import delete, or_, select, update
+
+from models import db, upsert, Job
+
+# Work too slow for a request is queued in the jobs table and run by a thread
+# in each web process or by `flask --app app run-jobs`, so it needs no broker,
+# SQLite included. A worker claims a job with one UPDATE, which takes a lease
+# of JOB_LEASE; if the worker dies, the job is claimed again once the lease
+# runs out. Failed jobs are retried with exponential backoff up to
+# max_attempts times. Handlers commit their own work and must be safe to run
+# again.
+JOB_LEASE = datetime.timedelta(minutes=10)
+JOB_RETRY_DELAY = datetime.timedelta(seconds=30)
+JOB_MAX_ATTEMPTS = 5
+JOB_POLL_SECONDS = 1.0
+JOB_KEEP_DAYS = 7
+
+JOB_HANDLERS: dict[str, Callable[..., Optional[dict]]] = {}
+
+
+def job_handler(kind: str):
+    # Registers a function as the handler of a job kind; it is called with the
+    # job payload as keyword arguments and may return a JSON result
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+
+    return register
+
+
+def create_jobs_table(conn):
+    Job.__table__.create(conn, checkfirst=True)
+
+
+def utcnow() -> datetime.datetime:
+    return datetime.datetime.now(timezone.utc)
+
+
+def enqueue(
+    kind: str,
+    payload: dict,
+    user_id: Optional[int] = None,
+    key: Optional[str] = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> int:
+    """Queues a job in the caller's transaction and returns its id. A job
+    already queued with the same idempotency key is returned instead of
+    adding another, e.g. for a form submitted twice."""
+    statement = upsert(Job).values(
+        kind=kind,
+        user_id=user_id,
+        payload=payload,
+        idempotency_key=key,
+        max_attempts=max_attempts,
+        run_after=utcnow(),
+    )
+    if key is not None:
+        statement = statement.on_conflict_do_nothing(index_elements=["idempotency_key"])
+    job_id = db.session.execute(statement.returning(Job.id)).scalar()
+    if job_id is None:
+        job_id = db.session.execute(
+            select(Job.id).where(Job.idempotency_key == key)
+        ).scalar_one()
+    return job_id
+
+
+def claim_job() -> Optional[Job]:
+    # Marks the next due job running and commits. Workers skip rows locked by
+    # each other on Postgres; SQLite runs one writer at a time anyway.
+    now = utcnow()
+    due = (
+        select(Job.id)
+        .where(
+            or_(
+                (Job.status == "queued") & (Job.run_after <= now),
+                (Job.status == "running") & (Job.locked_until < now),
+            )
+        )
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    job = db.session.execute(
+        update(Job)
+        .where(Job.id == due)
+        .values(
+            status="running",
+            attempts=Job.attempts + 1,
+            locked_until=now + JOB_LEASE,
+            updated=now,
+        )
+        .returning(Job)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.session.commit()
+    return job
+
+
+def finish_job(job_id: int, **values):
+    # The payload may hold user data, so it is dropped once no longer needed
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id)
+        .values(payload=None, locked_until=None, updated=utcnow(), **values)
+    )
+    db.session.commit()
+
+
+def run_job(job: Job):
+    job_id, kind, attempts = job.id, job.kind, job.attempts
+    max_attempts, payload = job.max_attempts, job.payload or {}
+    try:
+        if attempts > max_attempts:  # Its last worker stopped mid-run
+            raise RuntimeError(f"Gave up after {max_attempts} attempts")
+        if kind not in JOB_HANDLERS:
+            raise LookupError(f"No handler for {kind} jobs")
+        result = JOB_HANDLERS[kind](**payload)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Job %s (%s) failed", job_id, kind)
+        if attempts < max_attempts:
+            db.session.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(
+                    status="queued",
+                    error=str(e),
+                    run_after=utcnow() + JOB_RETRY_DELAY * 2 ** (attempts - 1),
+                    locked_until=None,
+                    updated=utcnow(),
+                )
+            )
+            db.session.commit()
+        else:
+            finish_job(job_id, status="failed", error=str(e))
+    else:
+        finish_job(job_id, status="done", result=result, error=None)
+
+
+def run_jobs(once: bool = False, poll_seconds: float = JOB_POLL_SECONDS) -> int:
+    """Runs due jobs one at a time, polling for more when the queue is empty,
+    or returning then if once is set. Returns how many jobs ran."""
+    n_jobs = 0
+    busy = True
+    while True:
+        job = claim_job()
+        if job is None:
+            if once:
+                return n_jobs
+            if busy:  # Finished jobs are pruned whenever the queue empties
+                prune_jobs()
+                busy = False
+            time.sleep(poll_seconds)
+            continue
+        run_job(job)
+        n_jobs += 1
+        busy = True
+        db.session.remove()
+
+
+def start_worker_thread(app) -> threading.Thread:
+    # Runs jobs in a web process, the development server or a gunicorn worker,
+    # so that no separate worker process is needed
+    def work():
+        with app.app_context():
+            run_jobs()
+
+    thread = threading.Thread(target=work, daemon=True)
+    thread.start()
+    return thread
+
+
+def prune_jobs(days: int = JOB_KEEP_DAYS):
+    db.session.execute(
+        delete(Job).where(
+            Job.status.in_(("done", "failed"))
+            & (Job.updated < utcnow() - datetime.timedelta(days=days))
+        )
+    )
+    db.session.commit()
+
+
+def job_status(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "created": job.created.isoformat(),
+        "updated": job.updated.isoformat() if job.updated else None,
+        "result": job.result,
+        "error": job.error,
+    }
+
+
+def get_job(user_id: int, job_id: int) -> Optional[Job]:
+    return db.session.execute(
+        select(Job).where((Job.id == job_id) & (Job.user_id == user_id))
+    ).scalar()
+
+
+def recent_jobs(user_id: int, limit: int = 5) -> list[Job]:
+    return (
+        db.session.execute(
+            select(Job)
+            .where(Job.user_id == user_id)
+            .order_by(Job.id.desc())
+            .limit(limit)
+        )
+        .scalars()
+        .all()
+    )
@@ -0,0 +1,233 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterator
+
+from flask import (
+    Response,
+    abort,
+    before_render_template,
+    current_app,
+    g,
+    request,
+    template_rendered,
+)
+
+# Upper bounds in seconds of the request duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    # Adds the time spent in the block to the named phase of this request
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = g.setdefault("phase_seconds", {})
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+def server_timing(request_g, elapsed: float) -> str:
+    sql_count = request_g.get("sql_query_count", 0)
+    sql_seconds = request_g.get("sql_seconds", 0.0)
+    timing = [f'sql;dur={sql_seconds * 1000:.1f};desc="{sql_count} queries"']
+    timing += [
+        f"{name};dur={s * 1000:.1f}"
+        for name, s in request_g.get("phase_seconds", {}).items()
+    ]
+    timing.append(f"total;dur={elapsed * 1000:.1f}")
+    return ", ".join(timing)
+
+
+class RouteStats:
+    __slots__ = ("buckets", "count", "seconds", "sql_statements", "sql_seconds")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+
+
+class Metrics:
+    """Per-request instrumentation. Each response carries a Server-Timing
+    header with SQL, template rendering and any timed() phases, and requests
+    are aggregated per route into histograms served at /metrics in the
+    Prometheus text format. Metrics are per process. Streamed responses are
+    aggregated once their body has been sent, but their Server-Timing header
+    only covers the time to the first byte.
+
+    If SLOW_REQUEST_MS is set, a SLOW_REQUEST_SAMPLE_RATE fraction of requests
+    record every SQL statement they run, and those slower than the threshold
+    are logged with their statements."""
+
+    def __init__(self, app=None):
+        self._routes = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_TOKEN", None)
+        app.config.setdefault("SLOW_REQUEST_MS", None)
+        app.config.setdefault("SLOW_REQUEST_SAMPLE_RATE", 1.0)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+        app.extensions["metrics"] = self
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        slow_ms = current_app.config["SLOW_REQUEST_MS"]
+        if slow_ms and random.random() < float(
+            current_app.config["SLOW_REQUEST_SAMPLE_RATE"]
+        ):
+            g.sql_statements = []
+
+    def _before_render(self, app, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    def _after_render(self, app, template, context, **extra):
+        started = g.pop("render_started", None)
+        if started is not None:
+            timings = g.setdefault("phase_seconds", {})
+            timings["render"] = (
+                timings.get("render", 0.0) + time.perf_counter() - started
+            )
+
+    def _after_request(self, response):
+        if "request_started" not in g:
+            return response
+        request_g = g._get_current_object()
+        response.headers["Server-Timing"] = server_timing(
+            request_g, time.perf_counter() - request_g.request_started
+        )
+        record = partial(
+            self._record,
+            current_app._get_current_object(),
+            request_g,
+            request.method,
+            request.endpoint or "unmatched",
+            request.path,
+            response.status_code,
+        )
+        if response.is_streamed:
+            # The body, with the SQL and phases it runs, is generated after
+            # this, so the request is recorded once it has been sent. The
+            # Server-Timing header goes out first and only covers the time to
+            # the first byte.
+            response.call_on_close(record)
+        else:
+            record()
+        return response
+
+    def _record(self, app, request_g, method, endpoint, path, status_code):
+        # request_g is the request's g, which a streamed body also writes to
+        elapsed = time.perf_counter() - request_g.request_started
+        sql_count = request_g.get("sql_query_count", 0)
+        sql_seconds = request_g.get("sql_seconds", 0.0)
+        route = (method, endpoint)
+        with self._lock:
+            stats = self._routes.setdefault(route, RouteStats())
+            for i, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    stats.buckets[i] += 1
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.sql_statements += sql_count
+            stats.sql_seconds += sql_seconds
+            status = (*route, status_code)
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+        slow_ms = app.config["SLOW_REQUEST_MS"]
+        statements = request_g.get("sql_statements")
+        if statements is not None and elapsed * 1000 >= float(slow_ms):
+            app.logger.warning(
+                "Slow request %s %s took %.1f ms (%s)\n%s",
+                method,
+                path,
+                elapsed * 1000,
+                server_timing(request_g, elapsed),
+                "\n".join(f"  {s * 1000:7.1f} ms  {sql}" for sql, s in statements),
+            )
+
+    def render(self) -> str:
+        lines = [
+            "# HELP lifecal_request_duration_seconds Request duration by route",
+            "# TYPE lifecal_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            statuses = sorted(self._statuses.items())
+            for (method, endpoint), stats in routes:
+                labels = f'method="{method}",route="{endpoint}"'
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    lines.append(
+                        f'lifecal_request_duration_seconds_bucket{{{labels},le="{bound}"}}'
+                        f" {count}"
+                    )
+                lines += [
+                    f'lifecal_request_duration_seconds_bucket{{{labels},le="+Inf"}}'
+                    f" {stats.count}",
+                    f"lifecal_request_duration_seconds_sum{{{labels}}} {stats.seconds}",
+                    f"lifecal_request_duration_seconds_count{{{labels}}} {stats.count}",
+                ]
+            lines += [
+                "# HELP lifecal_sql_statements_total SQL statements by route",
+                "# TYPE lifecal_sql_statements_total counter",
+            ]
+            lines += [
+                f'lifecal_sql_statements_total{{method="{method}",route="{endpoint}"}}'
+                f" {stats.sql_statements}"
+                for (method, endpoint), stats in routes
+            ]
+            lines += [
+                "# HELP lifecal_sql_seconds_total Time spent in SQL by route",
+                "# TYPE lifecal_sql_seconds_total counter",
+            ]
+            lines += [
+                f'lifecal_sql_seconds_total{{method="{method}",route="{endpoint}"}}'
+                f" {stats.sql_seconds}"
+                for (method, endpoint), stats in routes
+            ]
+            lines += [
+                "# HELP lifecal_responses_total Responses by route and status",
+                "# TYPE lifecal_responses_total counter",
+            ]
+            lines += [
+                f'lifecal_responses_total{{method="{method}",route="{endpoint}",'
+                f'status="{status}"}} {count}'
+                for (method, endpoint, status), count in statuses
+            ]
+        oauth_client = current_app.extensions.get("oauth_client")
+        if oauth_client is not None:
+            oauth_stats = oauth_client.stats()
+            for name, kind, key in (
+                ("oauth_calls_total", "counter", "count"),
+                ("oauth_errors_total", "counter", "errors"),
+                ("oauth_call_max_seconds", "gauge", "max_seconds"),
+            ):
+                lines.append(f"# TYPE lifecal_{name} {kind}")
+                for call_name, stats in sorted(oauth_stats.items()):
+                    provider, call = call_name.split(".")
+                    lines.append(
+                        f'lifecal_{name}{{provider="{provider}",call="{call}"}}'
+                        f" {stats[key]}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        token = current_app.config["METRICS_TOKEN"]
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
@@ -0,0 +1,192 @@
+from sqlalchemy import inspect, text
+
+from changes import create_tombstones_table
+from jobs import create_jobs_table
+from models import db
+from occupancy import add_occupancy_column, rebuild_occupancy
+from search import create_search_table, rebuild_search_index
+from stats import rebuild_tag_stats
+
+
+def merge_into(conn, table: str, link_column: str, keep: int, duplicate: int):
+    # Moves the entry_tag links of a duplicate row to the kept one, skipping
+    # links the kept row already has, then deletes the duplicate
+    other_column = "tag_id" if link_column == "entry_id" else "entry_id"
+    conn.execute(
+        text(
+            f"UPDATE entry_tag SET {link_column} = :keep "
+            f"WHERE {link_column} = :duplicate AND {other_column} NOT IN "
+            f"(SELECT {other_column} FROM entry_tag WHERE {link_column} = :keep)"
+        ),
+        {"keep": keep, "duplicate": duplicate},
+    )
+    conn.execute(
+        text(f"DELETE FROM entry_tag WHERE {link_column} = :duplicate"),
+        {"duplicate": duplicate},
+    )
+    conn.execute(text(f"DELETE FROM {table} WHERE id = :id"), {"id": duplicate})
+
+
+def merge_duplicates(conn):
+    """Merges the rows that the unique indexes of migration 1 would reject,
+    which the old read-then-write code could create: of a user's entries for
+    the same week, or tags with the same name, the one with the lowest id is
+    kept and takes over the tags of the others, and for entries their notes.
+    Users sharing an OAuth id cannot be merged safely, so they are reported
+    and the migration stops."""
+    oauth_ids = (
+        conn.execute(
+            text("SELECT oauth_id FROM users GROUP BY oauth_id HAVING COUNT(*) > 1")
+        )
+        .scalars()
+        .all()
+    )
+    if oauth_ids:
+        raise RuntimeError(
+            "Several users share each of these OAuth ids, merge or delete them"
+            f" before upgrading: {', '.join(oauth_ids)}"
+        )
+    for table, column, link_column in (
+        ("tags", "name", "tag_id"),
+        ("entries", "start", "entry_id"),
+    ):
+        duplicates = conn.execute(
+            text(
+                f"SELECT user_id, {column} FROM {table} "
+                f"GROUP BY user_id, {column} HAVING COUNT(*) > 1"
+            )
+        ).all()
+        for user_id, value in duplicates:
+            rows = conn.execute(
+                text(
+                    f"SELECT id{', note' if table == 'entries' else ''} FROM {table} "
+                    f"WHERE user_id = :user_id AND {column} = :value ORDER BY id"
+                ),
+                {"user_id": user_id, "value": value},
+            ).all()
+            keep = rows[0].id
+            for row in rows[1:]:
+                merge_into(conn, table, link_column, keep, row.id)
+            if table == "entries":
+                notes = dict.fromkeys(r.note for r in rows if r.note)
+                conn.execute(
+                    text("UPDATE entries SET note = :note WHERE id = :id"),
+                    {"note": "\n\n".join(notes) or None, "id": keep},
+                )
+            print(f"Merged {len(rows) - 1} duplicate {table} of user {user_id}")
+
+
+# Ordered (version, description, statements). Statements must work on both
+# Postgres and SQLite, and may be callables taking the connection for data
+# migrations; each migration runs in its own transaction.
+MIGRATIONS = [
+    (
+        1,
+        "Add unique indexes for logins, entry dates and tag names",
+        [
+            merge_duplicates,
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_oauth_id ON users (oauth_id)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_entries_user_id_start "
+            "ON entries (user_id, start)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_tags_user_id_name "
+            "ON tags (user_id, name)",
+        ],
+    ),
+    (
+        2,
+        "Add per-user tag statistics by year",
+        [
+            "CREATE TABLE IF NOT EXISTS tag_stats ("
+            "user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE, "
+            "tag_id INTEGER NOT NULL REFERENCES tags (id) ON DELETE CASCADE, "
+            "year INTEGER NOT NULL, "
+            "weeks INTEGER NOT NULL, "
+            "PRIMARY KEY (user_id, tag_id, year))",
+            rebuild_tag_stats,
+        ],
+    ),
+    (
+        3,
+        "Add the full-text search index over notes and tag names",
+        [create_search_table, rebuild_search_index],
+    ),
+    (
+        4,
+        "Mark accounts being deleted in the background",
+        ["ALTER TABLE users ADD COLUMN deleted_at TIMESTAMP WITH TIME ZONE"],
+    ),
+    (
+        5,
+        "Add the per-user bitmap of weeks with an entry",
+        [add_occupancy_column, rebuild_occupancy],
+    ),
+    (
+        6,
+        "Track revisions of entries, tags and settings for the changes feed",
+        [
+            "ALTER TABLE users ADD COLUMN revision INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE users ADD COLUMN settings_revision INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE entries ADD COLUMN revision INTEGER",
+            "ALTER TABLE entries ADD COLUMN updated TIMESTAMP WITH TIME ZONE",
+            "ALTER TABLE tags ADD COLUMN revision INTEGER",
+            "ALTER TABLE tags ADD COLUMN updated TIMESTAMP WITH TIME ZONE",
+            "UPDATE entries SET revision = 0, updated = created",
+            "UPDATE tags SET revision = 0, updated = created",
+            "CREATE INDEX IF NOT EXISTS ix_entries_user_id_revision "
+            "ON entries (user_id, revision)",
+            "CREATE INDEX IF NOT EXISTS ix_tags_user_id_revision "
+            "ON tags (user_id, revision)",
+            create_tombstones_table,
+        ],
+    ),
+    (
+        7,
+        "Add the background job queue",
+        [create_jobs_table],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version() -> int:
+    with db.engine.begin() as conn:
+        conn.execute(
+            text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        )
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def set_schema_version(conn, version: int):
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(
+        text("INSERT INTO schema_version (version) VALUES (:version)"),
+        {"version": version},
+    )
+
+
+def upgrade_db(app):
+    with app.app_context():
+        if not inspect(db.engine).has_table("users"):
+            # Empty database: create the current schema directly
+            print("Creating database schema")
+            db.create_all()
+            get_schema_version()
+            with db.engine.begin() as conn:
+                create_search_table(conn)  # Dialect specific, so not a model
+                set_schema_version(conn, LATEST_VERSION)
+            return
+        version = get_schema_version()
+        for migration_version, description, statements in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            print(f"Applying migration {migration_version}: {description}")
+            with db.engine.begin() as conn:
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(text(statement))
+                set_schema_version(conn, migration_version)
+        print(f"Database schema is at version {max(version, LATEST_VERSION)}")
@@ -4,10 +4,13 @@ from typing import List
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Enum, ForeignKey
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
-db = SQLAlchemy()
+from replica import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 entry_tag = db.Table(
     "entry_tag",
@@ -32,7 +35,7 @@ class User(UserMixin, db.Model):
     created = db.Column(
         db.DateTime(timezone=True), server_default=func.now(), nullable=False
     )
-    oauth_id = db.Column(db.String(100), nullable=False)
+    oauth_id = db.Column(db.String(100), nullable=False, unique=True, index=True)
     birth = db.Column(db.Date, nullable=False)
     exp_years = db.Column(db.Integer, nullable=False)
     tags: Mapped[List["Tag"]] = relationship(
@@ -42,10 +45,22 @@ class User(UserMixin, db.Model):
         back_populates="user", cascade="all, delete, delete-orphan"
     )
     email = db.Column(db.String(100), nullable=True)
+    # Set when the account is being deleted in the background, see deletion.py
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    # One bit per week with an entry, see occupancy.py
+    occupancy = db.Column(db.LargeBinary, nullable=True, default=b"")
+    # Last revision allocated to a change of this user's data, and the one at
+    # which birth or exp_years last changed, see changes.py
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    settings_revision = db.Column(db.Integer, nullable=False, default=0)
 
 
 class Entry(db.Model):
     __tablename__ = "entries"
+    __table_args__ = (
+        db.Index("uq_entries_user_id_start", "user_id", "start", unique=True),
+        db.Index("ix_entries_user_id_revision", "user_id", "revision"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     created = db.Column(
         db.DateTime(timezone=True), server_default=func.now(), nullable=False
@@ -60,10 +75,17 @@ class Entry(db.Model):
     start = db.Column(db.Date, nullable=False)
     # tag = db.Column(db.Integer, db.ForeignKey('tags.id'), nullable=False)
     note = db.Column(db.String, nullable=True)  # Optional
+    # Revision of the last change, None until stamped, see changes.py
+    revision = db.Column(db.Integer, nullable=True)
+    updated = db.Column(db.DateTime(timezone=True), nullable=True)
 
 
 class Tag(db.Model):
     __tablename__ = "tags"
+    __table_args__ = (
+        db.Index("uq_tags_user_id_name", "user_id", "name", unique=True),
+        db.Index("ix_tags_user_id_revision", "user_id", "revision"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     created = db.Column(
         db.DateTime(timezone=True), server_default=func.now(), nullable=False
@@ -81,10 +103,118 @@ class Tag(db.Model):
     category = db.Column(
         db.Integer, nullable=True
     )  # Optional, to use for showing/hiding layers of tags
+    revision = db.Column(db.Integer, nullable=True)
+    updated = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+class TagStat(db.Model):
+    # Weeks with an entry carrying the tag, per calendar year of the entry
+    # start. Kept up to date by writes.entries_changed() alongside every write.
+    __tablename__ = "tag_stats"
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tag_id = db.Column(
+        db.Integer, db.ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
+    )
+    year = db.Column(db.Integer, primary_key=True)
+    weeks = db.Column(db.Integer, nullable=False)
+
+
+class Tombstone(db.Model):
+    # A deleted entry or tag, kept so that clients syncing through
+    # /api/changes learn of the deletion
+    __tablename__ = "tombstones"
+    __table_args__ = (
+        db.Index("ix_tombstones_user_id_revision", "user_id", "revision"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    kind = db.Column(db.String(8), nullable=False)  # "entry" or "tag"
+    object_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(
+        db.DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class Job(db.Model):
+    # Work queued for `flask --app app run-jobs`, see jobs.py. user_id is who
+    # may poll it, with no foreign key as a job may outlive its user.
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_after", "status", "run_after"),
+        db.Index("ix_jobs_user_id", "user_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    created = db.Column(
+        db.DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated = db.Column(db.DateTime(timezone=True), nullable=True)
+    kind = db.Column(db.String(32), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.JSON, nullable=True)
+    idempotency_key = db.Column(db.String(100), nullable=True, unique=True)
+    status = db.Column(db.String(8), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_after = db.Column(db.DateTime(timezone=True), nullable=False)
+    locked_until = db.Column(db.DateTime(timezone=True), nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+
+def upsert(model: db.Model):
+    # INSERT supporting on_conflict_do_nothing/do_update for the active database
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def get_or_create_tags(
+    user_id: int, tag_names: list[str]
+) -> tuple[dict[str, Tag], list[str]]:
+    # Resolves all names with one IN query and creates the missing ones with one
+    # bulk upsert. Nothing is committed, so new tags land with the caller's
+    # transaction. Returns tags by name, in the given order, and created names.
+    tag_names = list(dict.fromkeys(t for t in tag_names if t))
+    tags_db = {
+        t.name: t
+        for t in db.session.execute(
+            db.select(Tag).where((Tag.user_id == user_id) & (Tag.name.in_(tag_names)))
+        ).scalars()
+    }
+    missing = [t for t in tag_names if t not in tags_db]
+    if missing:
+        created = db.session.execute(
+            upsert(Tag)
+            .values(
+                [{"user_id": user_id, "name": t, "color": "0000FFFF"} for t in missing]
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "name"])
+            .returning(Tag)
+        ).scalars()
+        tags_db.update((t.name, t) for t in created)
+        if len(tags_db) < len(tag_names):  # Created concurrently by another request
+            tags_db.update(
+                (t.name, t)
+                for t in db.session.execute(
+                    db.select(Tag).where(
+                        (Tag.user_id == user_id)
+                        & (Tag.name.in_([t for t in missing if t not in tags_db]))
+                    )
+                ).scalars()
+            )
+    return {t: tags_db[t] for t in tag_names}, missing
 
 
 def init_db(app):
-    print("Wiping database and initializing new data!")
+    with app.app_context():
+        if db.session.execute(db.select(User.id)).first() is not None:
+            return
+    print("Initializing database with test data!")
     user_1 = User(
         oauth_id="test_oauth_id", birth=date.fromisoformat("1995-03-06"), exp_years=80
     )
@@ -103,8 +233,6 @@ def init_db(app):
         note="Content of entry with tag 2",
     )
     with app.app_context():
-        db.drop_all()
-        db.create_all()
         db.session.add(user_1)
         # db.session.commit()
         db.session.add(tag_1)
@@ -112,4 +240,13 @@ def init_db(app):
         # db.session.commit()
         db.session.add(entry_1)
         db.session.add(entry_2)
+        db.session.flush()
+        # Imported here, as both modules build on this one
+        from occupancy import rebuild_occupancy
+        from search import rebuild_search_index
+        from stats import rebuild_tag_stats
+
+        rebuild_tag_stats(db.session)
+        rebuild_search_index(db.session)
+        rebuild_occupancy(db.session)
         db.session.commit()
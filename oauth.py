@@ -0,0 +1,168 @@
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+class OAuthError(Exception):
+    pass
+
+
+class CallStats:
+    __slots__ = ("count", "errors", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_seconds": self.total_seconds / self.count if self.count else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+class OAuthClient:
+    """HTTP client for the OAuth2 token and userinfo calls. Each provider gets
+    its own pooled Session, so logins reuse keep-alive connections, and every
+    call is bounded by connect/read timeouts and a few retries."""
+
+    def __init__(self, app=None):
+        self.timeout = (3.05, 10)
+        self.retries = 2
+        self.pool_size = 10
+        self.logger = None
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("OAUTH2_CONNECT_TIMEOUT", 3.05)
+        app.config.setdefault("OAUTH2_READ_TIMEOUT", 10)
+        app.config.setdefault("OAUTH2_RETRIES", 2)
+        app.config.setdefault("OAUTH2_POOL_SIZE", 10)
+        self.timeout = (
+            float(app.config["OAUTH2_CONNECT_TIMEOUT"]),
+            float(app.config["OAUTH2_READ_TIMEOUT"]),
+        )
+        self.retries = int(app.config["OAUTH2_RETRIES"])
+        self.pool_size = int(app.config["OAUTH2_POOL_SIZE"])
+        self.logger = app.logger
+        app.extensions["oauth_client"] = self
+
+    def session(self, provider: str) -> "requests.Session":
+        # requests is imported on first use to keep it off the cold start path
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        with self._lock:
+            if provider not in self._sessions:
+                session = requests.Session()
+                # Connection errors are retried for any method; read errors and
+                # 5xx only for GET, as authorization codes are single use
+                retry = Retry(
+                    total=self.retries,
+                    connect=self.retries,
+                    read=self.retries,
+                    status=self.retries,
+                    backoff_factor=0.2,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset({"GET"}),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["Accept"] = "application/json"
+                self._sessions[provider] = session
+            return self._sessions[provider]
+
+    def _request(self, provider: str, call: str, method: str, url: str, **kwargs):
+        import requests
+
+        started = time.perf_counter()
+        error = None
+        try:
+            response = self.session(provider).request(
+                method, url, timeout=self.timeout, **kwargs
+            )
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+            return response
+        except requests.RequestException as e:
+            error = type(e).__name__
+            raise OAuthError(f"{provider} {call} failed: {error}") from e
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats = self._stats.setdefault((provider, call), CallStats())
+                stats.count += 1
+                stats.total_seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, elapsed)
+                stats.errors += error is not None
+            if self.logger is not None:
+                self.logger.info(
+                    "OAuth %s %s took %.3fs%s",
+                    provider,
+                    call,
+                    elapsed,
+                    f" ({error})" if error else "",
+                )
+
+    def fetch_token(self, provider: str, provider_info: dict, **data) -> str:
+        response = self._request(
+            provider,
+            "token",
+            "POST",
+            provider_info["token_url"],
+            data={
+                "client_id": provider_info["client_id"],
+                "client_secret": provider_info["client_secret"],
+                "grant_type": "authorization_code",
+                **data,
+            },
+        )
+        if response.status_code != 200:
+            raise OAuthError(f"{provider} token failed: HTTP {response.status_code}")
+        try:
+            token = response.json()["access_token"]
+        except (ValueError, KeyError) as e:
+            raise OAuthError(f"{provider} token response has no access token") from e
+        if not token:
+            raise OAuthError(f"{provider} returned an empty access token")
+        return token
+
+    def fetch_userinfo(
+        self, provider: str, provider_info: dict, token: str
+    ) -> "requests.Response":
+        response = self._request(
+            provider,
+            "userinfo",
+            "GET",
+            provider_info["userinfo"]["url"],
+            headers={"Authorization": "Bearer " + token},
+        )
+        if response.status_code != 200:
+            raise OAuthError(f"{provider} userinfo failed: HTTP {response.status_code}")
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                f"{provider}.{call}": stats.as_dict()
+                for (provider, call), stats in self._stats.items()
+            }
+
+
+oauth_client = OAuthClient()
@@ -0,0 +1,77 @@
+"""A fake OAuth2 provider with authorize, token and userinfo endpoints, so the
+sign-in flow can be run and load-tested offline.
+
+Set OAUTH2_STUB=1 to start it in a background thread and register it as the
+"stub" provider, then sign in at /authorize/stub?login_hint=<name>. It can also be
+run on its own, with OAUTH2_STUB set to its URL:
+python oauth_stub.py [port] [delay in seconds]
+"""
+
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from flask import Flask, abort, jsonify, redirect, request
+from werkzeug.serving import make_server
+
+stub_app = Flask(__name__)
+# Seconds to sleep in the token and userinfo endpoints, to simulate slow providers
+stub_app.config["STUB_DELAY"] = 0.0
+
+
+@stub_app.route("/authorize")
+def authorize():
+    query = urlencode(
+        {
+            "code": "code-" + request.args.get("login_hint", "stub-user"),
+            "state": request.args["state"],
+        }
+    )
+    return redirect(request.args["redirect_uri"] + "?" + query)
+
+
+@stub_app.route("/token", methods=("POST",))
+def token():
+    time.sleep(stub_app.config["STUB_DELAY"])
+    code = request.form.get("code", "")
+    if not code.startswith("code-"):
+        abort(400)
+    return jsonify(access_token="token-" + code[len("code-") :], token_type="bearer")
+
+
+@stub_app.route("/userinfo")
+def userinfo():
+    time.sleep(stub_app.config["STUB_DELAY"])
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer token-"):
+        abort(401)
+    login = auth[len("Bearer token-") :]
+    return jsonify(id=login, sub=login)
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0) -> str:
+    # Threaded so concurrent logins against the stub do not queue up
+    server = make_server(host, port, stub_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{host}:{server.server_port}"
+
+
+def stub_provider(base_url: str) -> dict:
+    return {
+        "client_id": "stub",
+        "client_secret": "stub",
+        "authorize_url": base_url + "/authorize",
+        "token_url": base_url + "/token",
+        "userinfo": {
+            "url": base_url + "/userinfo",
+            "oauth_id": lambda r: "stub_" + str(r.json()["id"]),
+        },
+        "scopes": [],
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        stub_app.config["STUB_DELAY"] = float(sys.argv[2])
+    stub_app.run(port=int(sys.argv[1]) if len(sys.argv) > 1 else 5001, threaded=True)
@@ -0,0 +1,131 @@
+import datetime
+from datetime import date
+from itertools import groupby
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import select, text, true, update
+
+from grid import grid_start
+from models import db, Entry, User
+
+# users.occupancy holds one bit per week since the Monday of the birth week,
+# set if the user has an entry starting that week: bit i is bit i % 8 of byte
+# i // 8, and trailing empty bytes are dropped. Entries before that Monday
+# are not represented.
+
+
+def add_occupancy_column(conn):
+    binary = "BYTEA" if db.engine.dialect.name == "postgresql" else "BLOB"
+    conn.execute(text(f"ALTER TABLE users ADD COLUMN occupancy {binary}"))
+
+
+def week_index(start: date, d: date) -> Optional[int]:
+    days = (d - start).days
+    if days < 0 or days % 7 != 0:
+        return None
+    return days // 7
+
+
+def to_bitmap(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def week_indexes(start: date, starts: Iterable[date]) -> list[int]:
+    return [i for i in (week_index(start, d) for d in starts) if i is not None]
+
+
+def build_bitmap(start: date, starts: Iterable[date]) -> bytes:
+    return update_bitmap(b"", week_indexes(start, starts), ())
+
+
+def update_bitmap(bitmap: bytes, add: Iterable[int], remove: Iterable[int]) -> bytes:
+    bits = int.from_bytes(bitmap, "little")
+    for i in remove:
+        bits &= ~(1 << i)
+    for i in add:
+        bits |= 1 << i
+    return to_bitmap(bits)
+
+
+def is_filled(bitmap: bytes, i: int) -> bool:
+    return i // 8 < len(bitmap) and bool(bitmap[i // 8] >> (i % 8) & 1)
+
+
+def count_filled(bitmap: bytes, n_weeks: int) -> int:
+    return (int.from_bytes(bitmap, "little") & ((1 << n_weeks) - 1)).bit_count()
+
+
+def iter_runs(
+    bitmap: bytes, n_weeks: Optional[int] = None
+) -> Iterator[tuple[int, int]]:
+    # Filled weeks as (first week index, length), found by bit arithmetic on
+    # the whole bitmap as one integer rather than week by week
+    bits = int.from_bytes(bitmap, "little")
+    if n_weeks is not None:
+        bits &= (1 << n_weeks) - 1
+    i = 0
+    while bits:
+        empty = (bits & -bits).bit_length() - 1
+        bits >>= empty
+        i += empty
+        filled = (bits ^ (bits + 1)).bit_length() - 1
+        yield i, filled
+        bits >>= filled
+        i += filled
+
+
+def filled_dates(
+    bitmap: bytes, birth: date, exclude: Optional[date] = None
+) -> list[str]:
+    # ISO dates of the filled weeks, as the date pickers disable them
+    start = grid_start(birth)
+    skip = None if exclude is None else week_index(start, exclude)
+    return [
+        (start + datetime.timedelta(weeks=i)).isoformat()
+        for first, length in iter_runs(bitmap)
+        for i in range(first, first + length)
+        if i != skip
+    ]
+
+
+def get_occupancy(user_id: int) -> bytes:
+    return (
+        db.session.execute(select(User.occupancy).where(User.id == user_id)).scalar()
+        or b""
+    )
+
+
+def rebuild_occupancy(conn, user_id: int = None) -> Optional[bytes]:
+    # Recomputes the bitmaps from entries, for one user or everyone, one user
+    # at a time, and returns the last user's bitmap; the caller commits
+    condition = true() if user_id is None else User.id == user_id
+    conn.execute(update(User).where(condition).values(occupancy=b""))
+    bitmap = b""
+    rows = conn.execute(
+        select(Entry.user_id, User.birth, Entry.start)
+        .join(User, User.id == Entry.user_id)
+        .where(condition)
+        .order_by(Entry.user_id)
+    ).all()
+    for (row_id, birth), user_rows in groupby(rows, key=lambda r: r[:2]):
+        bitmap = build_bitmap(grid_start(birth), (r.start for r in user_rows))
+        conn.execute(update(User).where(User.id == row_id).values(occupancy=bitmap))
+    return bitmap
+
+
+def update_occupancy(user_id: int, before: set[date], after: set[date]):
+    # Sets the bits of the weeks in after and clears those only in before,
+    # with the user row locked, so concurrent writes do not lose each other's
+    # bits. Runs in the caller's transaction.
+    if before == after:
+        return
+    birth, bitmap = db.session.execute(
+        select(User.birth, User.occupancy).where(User.id == user_id).with_for_update()
+    ).one()
+    start = grid_start(birth)
+    bitmap = update_bitmap(
+        bitmap or b"",
+        week_indexes(start, after),
+        week_indexes(start, before - after),
+    )
+    db.session.execute(update(User).where(User.id == user_id).values(occupancy=bitmap))
@@ -0,0 +1,65 @@
+import time
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class TooManyQueries(Exception):
+    pass
+
+
+class QueryCounter:
+    """Counts SQL statements and the time spent in them per request. If
+    SQL_QUERY_LIMIT is set, a request that issues more statements than that
+    fails with TooManyQueries, so N+1 regressions are caught by tests instead
+    of in production. If g.sql_statements is a list, each statement and its
+    duration is appended to it."""
+
+    def __init__(self, app=None):
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQL_QUERY_LIMIT", None)
+        if not self._listening:  # Engine events are global, listen only once
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+        app.extensions["query_counter"] = self
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if not has_request_context():
+            return
+        g.sql_query_count = g.get("sql_query_count", 0) + 1
+        limit = current_app.config["SQL_QUERY_LIMIT"]
+        if limit and g.sql_query_count > int(limit):
+            raise TooManyQueries(
+                f"Request issued more than {limit} SQL statements: {statement}"
+            )
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if not has_request_context() or not conn.info.get("query_started"):
+            return
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+        statements = g.get("sql_statements")
+        if statements is not None:
+            statements.append((statement, elapsed))
+
+
+def get_query_count() -> int:
+    return g.get("sql_query_count", 0)
+
+
+def get_query_seconds() -> float:
+    return g.get("sql_seconds", 0.0)
+
+
+query_counter = QueryCounter()
@@ -0,0 +1,119 @@
+import time
+from typing import Callable
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Session key holding the time until which this browser reads from the primary
+STICKY_KEY = "_primary_until"
+
+
+def engine_options(url: str, config) -> dict:
+    # Pool and timeout options for one database URL. SQLite has no server to
+    # lose connections to, so it only gets what applies to it.
+    if make_url(url).get_backend_name() == "sqlite":
+        return {"pool_pre_ping": True}
+    options = {
+        "pool_size": int(config["DB_POOL_SIZE"]),
+        "max_overflow": int(config["DB_MAX_OVERFLOW"]),
+        "pool_timeout": float(config["DB_POOL_TIMEOUT"]),
+        # Recycled before Fly's proxy or Postgres drop idle connections
+        "pool_recycle": int(config["DB_POOL_RECYCLE"]),
+        "pool_pre_ping": True,
+    }
+    if config["DB_STATEMENT_TIMEOUT_MS"]:
+        timeout = int(config["DB_STATEMENT_TIMEOUT_MS"])
+        options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def read_only(view: Callable) -> Callable:
+    # Marks a view whose GET requests may read from the replica
+    view.replica_ok = True
+    return view
+
+
+def reading_replica() -> bool:
+    # Replica reads may lag the primary, so they must not fill shared caches
+    return has_request_context() and bool(g.get("use_replica"))
+
+
+class RoutingSession(Session):
+    """Sends reads to the "replica" bind while a request is routed there, and
+    everything else, including any write, to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and reading_replica()
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+        ):
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Configures engine pools from DB_* settings and, if
+    SQLALCHEMY_REPLICA_URI is set, routes GET requests to views marked
+    read_only() to that replica. For read-your-writes, any request that
+    writes pins the browser to the primary for REPLICA_STICKY_SECONDS, which
+    should exceed the replication lag. Must be initialised before db."""
+
+    def __init__(self, app=None):
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_REPLICA_URI", None)
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 10)
+        app.config.setdefault("DB_POOL_SIZE", 5)
+        app.config.setdefault("DB_MAX_OVERFLOW", 10)
+        app.config.setdefault("DB_POOL_TIMEOUT", 10)
+        app.config.setdefault("DB_POOL_RECYCLE", 1800)
+        app.config.setdefault("DB_STATEMENT_TIMEOUT_MS", None)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+            app.config["SQLALCHEMY_DATABASE_URI"], app.config
+        )
+        replica = app.config["SQLALCHEMY_REPLICA_URI"]
+        if replica:
+            app.config.setdefault("SQLALCHEMY_BINDS", {})["replica"] = {
+                "url": replica,
+                **engine_options(replica, app.config),
+            }
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+        if not self._listening:  # Session events are global, listen only once
+            event.listen(RoutingSession, "after_flush", self._written)
+            event.listen(RoutingSession, "do_orm_execute", self._orm_execute)
+            self._listening = True
+        app.extensions["replica_router"] = self
+
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        g.use_replica = (
+            request.method in ("GET", "HEAD")
+            and getattr(view, "replica_ok", False)
+            and session.get(STICKY_KEY, 0) < time.time()
+        )
+
+    def _after_request(self, response):
+        if g.get("db_written"):
+            session[STICKY_KEY] = time.time() + float(
+                current_app.config["REPLICA_STICKY_SECONDS"]
+            )
+        return response
+
+    def _written(self, *args):
+        if has_request_context():
+            g.db_written = True
+
+    def _orm_execute(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            self._written()
+
+
+replica_router = ReplicaRouter()
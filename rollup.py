@@ -0,0 +1,109 @@
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Iterator
+
+from sqlalchemy import Integer, cast, extract, func, select
+
+from grid import grid_bounds
+from models import db, entry_tag, Entry, Tag, TagStat
+from stats import ENTRY_YEAR
+
+# Coarser views of the grid, one cell per calendar month, year or decade. A
+# week belongs to the cell of its Monday, as in the tag statistics. Each
+# cell is summarised from what is already kept per user rather than from the
+# weeks themselves: filled weeks are counted off the occupancy bitmap a cell
+# at a time, and the dominant tag comes from tag_stats for years and decades,
+# and from one grouped query over entries for months.
+ZOOMS = ("week", "month", "year", "decade")
+ENTRY_MONTH = cast(extract("month", Entry.start), Integer)
+
+
+def bucket_start(d: date, zoom: str) -> date:
+    if zoom == "month":
+        return d.replace(day=1)
+    if zoom == "year":
+        return date(d.year, 1, 1)
+    return date(d.year - d.year % 10, 1, 1)
+
+
+def next_bucket(d: date, zoom: str) -> date:
+    if zoom == "month":
+        return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+    return date(d.year + (1 if zoom == "year" else 10), 1, 1)
+
+
+def iter_buckets(
+    start: date, n_weeks: int, zoom: str
+) -> Iterator[tuple[date, int, int]]:
+    # (first day of the cell, first week index, end week index) of each cell
+    # from the week at start on, computed from dates so without walking weeks
+    first = 0
+    bucket = bucket_start(start, zoom)
+    while first < n_weeks:
+        following = next_bucket(bucket, zoom)
+        end = min(-(-(following - start).days // 7), n_weeks)
+        yield bucket, first, end
+        first, bucket = end, following
+
+
+def bucket_tag_weeks(user_id: int, zoom: str) -> dict[date, Counter]:
+    # Weeks by tag id for each cell with any
+    if zoom == "month":
+        rows = db.session.execute(
+            select(ENTRY_YEAR, ENTRY_MONTH, entry_tag.c.tag_id, func.count())
+            .select_from(Entry)
+            .join(entry_tag, entry_tag.c.entry_id == Entry.id)
+            .where(Entry.user_id == user_id)
+            .group_by(ENTRY_YEAR, ENTRY_MONTH, entry_tag.c.tag_id)
+        )
+        rows = ((date(year, month, 1), tag_id, n) for year, month, tag_id, n in rows)
+    else:
+        year = TagStat.year if zoom == "year" else TagStat.year // 10 * 10
+        rows = db.session.execute(
+            select(year, TagStat.tag_id, func.sum(TagStat.weeks))
+            .where(TagStat.user_id == user_id)
+            .group_by(year, TagStat.tag_id)
+        )
+        rows = ((date(year, 1, 1), tag_id, n) for year, tag_id, n in rows)
+    tag_weeks = defaultdict(Counter)
+    for bucket, tag_id, n in rows:
+        tag_weeks[bucket][tag_id] += n
+    return tag_weeks
+
+
+def get_rollup(
+    user_id: int, birth: date, exp_years: int, bitmap: bytes, zoom: str
+) -> dict:
+    """The grid at a zoom coarser than weeks: per cell, its first day, number
+    of weeks, past weeks, filled weeks and the id of the tag on most of its
+    weeks, with the name and color of each such tag."""
+    start, n_weeks, past_weeks = grid_bounds(birth, exp_years)
+    tag_weeks = bucket_tag_weeks(user_id, zoom)
+    bits = int.from_bytes(bitmap, "little")
+    cells = []
+    for bucket, first, end in iter_buckets(start, n_weeks, zoom):
+        weeks = end - first
+        filled = (bits & ((1 << weeks) - 1)).bit_count()
+        bits >>= weeks
+        counts = tag_weeks.get(bucket)
+        # Ties go to the oldest tag
+        tag_id = min(counts, key=lambda t: (-counts[t], t)) if counts else None
+        past = min(max(past_weeks - first, 0), weeks)
+        cells.append([bucket.isoformat(), weeks, past, filled, tag_id])
+    tag_ids = {cell[4] for cell in cells} - {None}
+    tags = {
+        tag_id: [name, color]
+        for tag_id, name, color in db.session.execute(
+            select(Tag.id, Tag.name, Tag.color).where(Tag.id.in_(tag_ids))
+        )
+    }
+    return {
+        "zoom": zoom,
+        "birth": birth.isoformat(),
+        "exp_years": exp_years,
+        "start": start.isoformat(),
+        "weeks": n_weeks,
+        "past": past_weeks,
+        "cells": cells,
+        "tags": tags,
+    }
@@ -0,0 +1,228 @@
+import re
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterator, Optional
+
+from markupsafe import escape
+from sqlalchemy import bindparam, select, text, true
+
+from models import db, entry_tag, Entry, Tag
+
+SEARCH_PAGE_SIZE = 20
+# Snippet delimiters that cannot occur in notes, swapped for <mark> after escaping
+MARK_START, MARK_END = "\x02", "\x03"
+
+
+def create_search_table(conn):
+    # Not a model, as the index is dialect specific: a tsvector column with a
+    # GIN index on Postgres, an FTS5 table keyed by entry id on SQLite. Both
+    # stem English words, so "run" also finds "running". FTS5 cannot index
+    # user_id as such, so an owner token restricts matches to one user inside
+    # the full-text index instead of filtering them afterwards.
+    if db.engine.dialect.name == "postgresql":
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS entry_search ("
+                "entry_id INTEGER PRIMARY KEY "
+                "REFERENCES entries (id) ON DELETE CASCADE, "
+                "user_id INTEGER NOT NULL, "
+                "start DATE NOT NULL, "
+                "document TEXT NOT NULL, "
+                "search_vector TSVECTOR NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_entry_search_vector "
+                "ON entry_search USING GIN (search_vector)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_entry_search_user_id "
+                "ON entry_search (user_id)"
+            )
+        )
+    else:
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entry_search USING fts5("
+                "document, owner, user_id UNINDEXED, start UNINDEXED, "
+                "tokenize = 'porter unicode61')"
+            )
+        )
+
+
+def entry_documents(conn, entry_ids: list[int]) -> list[dict]:
+    # Note and tag names of each entry, as the text to index
+    entries = {}
+    for entry_id, user_id, start, note, tag_name in conn.execute(
+        select(Entry.id, Entry.user_id, Entry.start, Entry.note, Tag.name)
+        .outerjoin(entry_tag, entry_tag.c.entry_id == Entry.id)
+        .outerjoin(Tag, Tag.id == entry_tag.c.tag_id)
+        .where(Entry.id.in_(entry_ids))
+        .order_by(Entry.id, Tag.name)
+    ):
+        if entry_id not in entries:
+            entries[entry_id] = {
+                "entry_id": entry_id,
+                "user_id": user_id,
+                "start": start,
+                "words": [note] if note else [],
+            }
+        if tag_name is not None:
+            entries[entry_id]["words"].append(tag_name)
+    return [
+        {
+            "entry_id": e["entry_id"],
+            "user_id": e["user_id"],
+            "start": e["start"].isoformat(),
+            "document": "\n".join(e["words"]),
+        }
+        for e in entries.values()
+    ]
+
+
+def delete_entry_index(conn, entry_ids: list[int]):
+    key = "entry_id" if db.engine.dialect.name == "postgresql" else "rowid"
+    conn.execute(
+        text(f"DELETE FROM entry_search WHERE {key} IN :ids").bindparams(
+            bindparam("ids", expanding=True)
+        ),
+        {"ids": list(entry_ids)},
+    )
+
+
+def reindex_entries(conn, entry_ids: list[int]):
+    # Replaces the index rows of the given entries with their current text;
+    # ids of deleted entries just lose theirs
+    if not entry_ids:
+        return
+    delete_entry_index(conn, entry_ids)
+    documents = entry_documents(conn, list(entry_ids))
+    if not documents:
+        return
+    if db.engine.dialect.name == "postgresql":
+        statement = (
+            "INSERT INTO entry_search "
+            "(entry_id, user_id, start, document, search_vector) "
+            "VALUES (:entry_id, :user_id, CAST(:start AS DATE), :document, "
+            "to_tsvector('english', :document))"
+        )
+    else:
+        statement = (
+            "INSERT INTO entry_search (rowid, owner, user_id, start, document) "
+            "VALUES (:entry_id, 'u' || :user_id, :user_id, :start, :document)"
+        )
+    conn.execute(text(statement), documents)
+
+
+def rebuild_search_index(conn, user_id: int = None):
+    # Reindexes every entry, of one user or everyone; the caller commits
+    condition = true() if user_id is None else Entry.user_id == user_id
+    entry_ids = conn.execute(select(Entry.id).where(condition)).scalars().all()
+    if user_id is None:
+        conn.execute(text("DELETE FROM entry_search"))
+    for i in range(0, len(entry_ids), 1000):
+        reindex_entries(conn, entry_ids[i : i + 1000])
+
+
+def delete_user_index(conn, user_id: int):
+    # Before the entries themselves go. FTS5 can only find rows by user_id with
+    # a full scan, so SQLite looks them up by entry id instead.
+    if db.engine.dialect.name == "postgresql":
+        statement = "DELETE FROM entry_search WHERE user_id = :user_id"
+    else:
+        statement = (
+            "DELETE FROM entry_search WHERE rowid IN "
+            "(SELECT id FROM entries WHERE user_id = :user_id)"
+        )
+    conn.execute(text(statement), {"user_id": user_id})
+
+
+def matching_entry_ids(user_id: int, condition) -> set[int]:
+    return set(
+        db.session.execute(
+            select(Entry.id)
+            .select_from(Entry)
+            .outerjoin(entry_tag, entry_tag.c.entry_id == Entry.id)
+            .where((Entry.user_id == user_id) & condition)
+        ).scalars()
+    )
+
+
+@contextmanager
+def indexed(user_id: int, condition) -> Iterator[None]:
+    """Keeps the search index in step with a write that changes the indexed
+    text of the user's entries matching condition, before and after, such as
+    renaming one of their tags. Runs in the caller's transaction."""
+    before = matching_entry_ids(user_id, condition)
+    yield
+    db.session.flush()
+    after = matching_entry_ids(user_id, condition)
+    reindex_entries(db.session, sorted(before | after))
+
+
+def search_terms(query: str) -> list[str]:
+    # Words only, so user input never reaches either query syntax
+    return re.findall(r"[^\W_]+", query.lower())[:16]
+
+
+def render_snippet(snippet: str) -> str:
+    return (
+        str(escape(snippet)).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+    )
+
+
+def search_entries(
+    user_id: int,
+    query: str,
+    after: Optional[tuple[float, date]] = None,
+    limit: int = SEARCH_PAGE_SIZE,
+) -> tuple[list[dict], Optional[tuple[float, date]]]:
+    """Best matches first, as (results, cursor for the next page). Pages are
+    keyset paginated on (score, start), which is unique per user, so a page
+    costs the same however deep it is."""
+    terms = search_terms(query)
+    if not terms:
+        return [], None
+    params = {"limit": limit + 1}
+    if db.engine.dialect.name == "postgresql":
+        params["user_id"] = user_id
+        params["query"] = " & ".join(f"{t}:*" for t in terms)
+        statement = (
+            "SELECT entry_id, start, score, ts_headline('english', document, q, "
+            f"'StartSel={MARK_START}, StopSel={MARK_END}, MaxFragments=1, "
+            "MaxWords=20, MinWords=5') AS snippet FROM ("
+            "SELECT entry_id, start, document, q, ts_rank(search_vector, q) AS score "
+            "FROM entry_search, to_tsquery('english', :query) AS q "
+            "WHERE user_id = :user_id AND search_vector @@ q) AS matches"
+        )
+    else:
+        terms = " ".join(f'"{t}"*' for t in terms)
+        params["query"] = f"owner:u{user_id} AND document:({terms})"
+        statement = (
+            "SELECT entry_id, start, score, snippet FROM ("
+            "SELECT rowid AS entry_id, start, -bm25(entry_search, 1.0, 0.0) AS score, "
+            "snippet(entry_search, 0, char(2), char(3), '…', 16) AS snippet "
+            "FROM entry_search WHERE entry_search MATCH :query) AS matches"
+        )
+    if after is not None:
+        statement += " WHERE score < :score OR (score = :score AND start < :start)"
+        params["score"], params["start"] = after[0], after[1].isoformat()
+    statement += " ORDER BY score DESC, start DESC LIMIT :limit"
+    rows = db.session.execute(text(statement), params).all()
+    results = [
+        {
+            "id": entry_id,
+            "start": str(start),
+            "score": score,
+            "snippet": render_snippet(snippet or ""),
+        }
+        for entry_id, start, score, snippet in rows[:limit]
+    ]
+    cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        cursor = (last.score, date.fromisoformat(str(last.start)))
+    return results, cursor
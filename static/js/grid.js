@@ -0,0 +1,249 @@
+// Draws the life grid from the packed /api/grid payload onto one canvas,
+// with a single tooltip element shared by every cell. At the month, year and
+// decade zoom levels each cell summarises its weeks: the share filled, in the
+// color of the tag on most of them.
+(function () {
+    const CELL = 16;  // Same size and spacing as the old .entry divs
+    const GAP = 8;
+    const DAY_MS = 24 * 60 * 60 * 1000;
+    // Cell size and columns by zoom level; weeks fill the width
+    const LAYOUTS = {week: [CELL, 0], month: [CELL, 12], year: [28, 10], decade: [48, 0]};
+    const FINER = {month: "week", year: "month", decade: "year"};
+
+    const canvas = document.getElementById("grid-canvas");
+    const tooltip = document.getElementById("grid-tooltip");
+    if (!canvas) {
+        return;
+    }
+    let grid = null;
+    let zoom = "week";
+    let cell = CELL;
+    let pitch = CELL + GAP;
+    let count = 0;  // Cells drawn
+    let columns = 1;
+    let filled = null;  // Week index -> entry id
+    let weekOf = null;  // Entry id -> week index
+    let matched = new Set();  // Week indexes of search results
+
+    function weekDate(i) {
+        return new Date(grid.startMs + i * 7 * DAY_MS).toISOString().slice(0, 10);
+    }
+
+    function cellAt(event) {
+        const rect = canvas.getBoundingClientRect();
+        const x = event.clientX - rect.left;
+        const y = event.clientY - rect.top;
+        const col = Math.floor(x / pitch);
+        const row = Math.floor(y / pitch);
+        if (col >= columns || x % pitch > cell + GAP / 2 || y % pitch > cell + GAP / 2) {
+            return null;
+        }
+        const i = row * columns + col;
+        return i < count ? i : null;
+    }
+
+    function tagColor(tagId) {
+        const color = tagId === null ? null : grid.tags[tagId][1];
+        if (color && /^[0-9a-f]{6}([0-9a-f]{2})?$/i.test(color)) {
+            return "#" + color;  // The default color has no leading #
+        }
+        return color || "blue";
+    }
+
+    function drawSummary(ctx, i, x, y) {
+        const [, weeks, past, filledWeeks, tagId] = grid.cells[i];
+        ctx.fillStyle = past ? "grey" : "white";
+        ctx.setLineDash(past ? [] : [3, 2]);
+        ctx.fillRect(x, y, cell - 1, cell - 1);
+        if (filledWeeks) {
+            // Filled from the bottom, in proportion to the weeks filled
+            const height = Math.max((cell - 1) * filledWeeks / weeks, 1);
+            ctx.fillStyle = tagColor(tagId);
+            ctx.fillRect(x, y + cell - 1 - height, cell - 1, height);
+        }
+        ctx.strokeRect(x, y, cell - 1, cell - 1);
+    }
+
+    function draw() {
+        const ratio = window.devicePixelRatio || 1;
+        const width = canvas.parentElement.clientWidth;
+        columns = LAYOUTS[zoom][1] || Math.max(Math.floor(width / pitch), 1);
+        const height = Math.ceil(count / columns) * pitch;
+        canvas.style.width = width + "px";
+        canvas.style.height = height + "px";
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+        const ctx = canvas.getContext("2d");
+        ctx.scale(ratio, ratio);
+        ctx.lineWidth = 1;
+        for (let i = 0; i < count; i++) {
+            const x = (i % columns) * pitch + GAP / 2 + 0.5;
+            const y = Math.floor(i / columns) * pitch + GAP / 2 + 0.5;
+            if (zoom !== "week") {
+                drawSummary(ctx, i, x, y);
+                continue;
+            }
+            if (filled.has(i)) {
+                ctx.fillStyle = "blue";
+                ctx.setLineDash([]);
+            } else if (i < grid.past) {
+                ctx.fillStyle = "grey";
+                ctx.setLineDash([]);
+            } else {
+                ctx.fillStyle = "white";
+                ctx.setLineDash([3, 2]);
+            }
+            ctx.fillRect(x, y, cell - 1, cell - 1);
+            ctx.strokeRect(x, y, cell - 1, cell - 1);
+        }
+        ctx.setLineDash([]);
+        ctx.lineWidth = 3;
+        ctx.strokeStyle = "orange";
+        for (const i of zoom === "week" ? matched : []) {
+            const x = (i % columns) * pitch + GAP / 2 + 0.5;
+            const y = Math.floor(i / columns) * pitch + GAP / 2 + 0.5;
+            ctx.strokeRect(x - 2, y - 2, cell + 3, cell + 3);
+        }
+    }
+
+    function cellLabel(i) {
+        if (zoom === "week") {
+            return weekDate(i);
+        }
+        const [start, weeks, , filledWeeks, tagId] = grid.cells[i];
+        const label = {month: start.slice(0, 7), year: start.slice(0, 4), decade: start.slice(0, 4) + "s"}[zoom];
+        const tag = tagId === null ? "" : ", mostly " + grid.tags[tagId][0];
+        return `${label}: ${filledWeeks} of ${weeks} weeks${tag}`;
+    }
+
+    function cellUrl(i) {
+        if (zoom !== "week") {
+            // Zooms in to the next finer level
+            const finer = FINER[zoom];
+            return canvas.dataset.indexUrl + (finer === "week" ? "" : "?zoom=" + finer);
+        } else if (filled.has(i)) {
+            return canvas.dataset.addUrl.replace(/add$/, filled.get(i) + "/edit");
+        } else if (i < grid.past) {
+            return canvas.dataset.addUrl + "?start=" + weekDate(i);
+        }
+        return null;
+    }
+
+    canvas.addEventListener("mousemove", function (event) {
+        const i = cellAt(event);
+        if (i === null) {
+            tooltip.hidden = true;
+            canvas.style.cursor = "default";
+            return;
+        }
+        tooltip.textContent = cellLabel(i);
+        tooltip.style.left = event.pageX + 12 + "px";
+        tooltip.style.top = event.pageY + 12 + "px";
+        tooltip.hidden = false;
+        canvas.style.cursor = cellUrl(i) ? "pointer" : "default";
+    });
+    canvas.addEventListener("mouseleave", function () {
+        tooltip.hidden = true;
+    });
+    canvas.addEventListener("click", function (event) {
+        const i = cellAt(event);
+        const url = i === null ? null : cellUrl(i);
+        if (url) {
+            window.location.href = url;
+        }
+    });
+    window.addEventListener("resize", function () {
+        if (grid) {
+            draw();
+        }
+    });
+
+    function load(payload) {
+        grid = payload;
+        grid.startMs = Date.parse(payload.start + "T00:00:00Z");
+        zoom = payload.zoom || "week";
+        cell = LAYOUTS[zoom][0];
+        pitch = cell + GAP;
+        count = zoom === "week" ? payload.weeks : payload.cells.length;
+        if (zoom !== "week") {
+            draw();
+            return;
+        }
+        filled = new Map();
+        weekOf = new Map();
+        let n = 0;
+        for (const [first, length] of payload.runs) {
+            for (let i = first; i < first + length; i++) {
+                filled.set(i, payload.entry_ids[n]);
+                weekOf.set(payload.entry_ids[n++], i);
+            }
+        }
+        draw();
+    }
+
+    // Search results are listed above the grid and outlined on it
+    const searchForm = document.getElementById("grid-search");
+    const searchResults = document.getElementById("search-results");
+    const searchMore = document.getElementById("search-more");
+    let searchNext = null;
+
+    function search(query, after) {
+        const params = new URLSearchParams({q: query});
+        if (after) {
+            params.set("after", after);
+        }
+        fetch(searchForm.dataset.searchUrl + "?" + params, {credentials: "same-origin"})
+            .then(response => response.json())
+            .then(payload => {
+                for (const result of payload.results) {
+                    const link = document.createElement("a");
+                    link.className = "list-group-item list-group-item-action";
+                    link.href = canvas.dataset.addUrl.replace(/add$/, result.id + "/edit");
+                    const start = document.createElement("b");
+                    start.textContent = result.start + " ";
+                    const snippet = document.createElement("span");
+                    snippet.innerHTML = result.snippet;  // Escaped by the server
+                    link.append(start, snippet);
+                    searchResults.append(link);
+                    if (weekOf && weekOf.has(result.id)) {
+                        matched.add(weekOf.get(result.id));
+                    }
+                }
+                searchResults.hidden = searchResults.childElementCount === 0;
+                searchNext = payload.next;
+                searchMore.hidden = !searchNext;
+                if (grid) {
+                    draw();
+                }
+            });
+    }
+
+    searchForm.addEventListener("submit", function (event) {
+        event.preventDefault();
+        searchResults.replaceChildren();
+        matched = new Set();
+        searchNext = null;
+        const query = searchForm.elements.q.value.trim();
+        if (query) {
+            search(query, null);
+        } else {
+            searchResults.hidden = searchMore.hidden = true;
+            if (grid) {
+                draw();
+            }
+        }
+    });
+    searchMore.addEventListener("click", function () {
+        search(searchForm.elements.q.value.trim(), searchNext);
+    });
+
+    // GET / streams the payload inline after the canvas; fetch it otherwise
+    const inline = document.getElementById("grid-data");
+    if (inline && inline.textContent.trim()) {
+        load(JSON.parse(inline.textContent));
+    } else {
+        fetch(canvas.dataset.gridUrl, {credentials: "same-origin"})
+            .then(response => response.json())
+            .then(load);
+    }
+})();
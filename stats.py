@@ -0,0 +1,92 @@
+from collections import Counter
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import Integer, cast, delete, extract, func, insert, select, true
+
+from models import db, entry_tag, upsert, Entry, Tag, TagStat
+
+ENTRY_YEAR = cast(extract("year", Entry.start), Integer)
+
+
+def count_tag_weeks(rows: Iterable[tuple[int, date, Optional[int]]]) -> Counter:
+    # Weeks by (tag id, year) over (entry id, start, tag id) rows, as read by
+    # writes.matching_rows()
+    return Counter(
+        (tag_id, start.year) for _, start, tag_id in rows if tag_id is not None
+    )
+
+
+def apply_tag_deltas(user_id: int, deltas: dict[tuple[int, int], int]):
+    deltas = {k: v for k, v in deltas.items() if v}
+    shrunk = {tag_id for (tag_id, _), weeks in deltas.items() if weeks < 0}
+    if shrunk:
+        # Tags deleted by the write lose their rows instead, as upserting a
+        # delta for them would violate the foreign key. Postgres has already
+        # dropped the rows by ON DELETE CASCADE; SQLite does not enforce it.
+        deleted = shrunk - set(
+            db.session.execute(select(Tag.id).where(Tag.id.in_(shrunk))).scalars()
+        )
+        if deleted:
+            db.session.execute(
+                delete(TagStat).where(
+                    (TagStat.user_id == user_id) & TagStat.tag_id.in_(deleted)
+                )
+            )
+            deltas = {k: v for k, v in deltas.items() if k[0] not in deleted}
+    if not deltas:
+        return
+    statement = upsert(TagStat).values(
+        [
+            {"user_id": user_id, "tag_id": tag_id, "year": year, "weeks": weeks}
+            for (tag_id, year), weeks in deltas.items()
+        ]
+    )
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["user_id", "tag_id", "year"],
+            set_={"weeks": TagStat.weeks + statement.excluded.weeks},
+        )
+    )
+    if any(v < 0 for v in deltas.values()):
+        db.session.execute(
+            delete(TagStat).where((TagStat.user_id == user_id) & (TagStat.weeks <= 0))
+        )
+
+
+def rebuild_tag_stats(conn, user_id: int = None):
+    # Recomputes the table from entries, for one user or everyone; conn is a
+    # Connection or Session, and the caller commits
+    condition = true() if user_id is None else Entry.user_id == user_id
+    conn.execute(
+        delete(TagStat).where(true() if user_id is None else TagStat.user_id == user_id)
+    )
+    conn.execute(
+        insert(TagStat).from_select(
+            ["user_id", "tag_id", "year", "weeks"],
+            select(Entry.user_id, entry_tag.c.tag_id, ENTRY_YEAR, func.count())
+            .select_from(Entry)
+            .join(entry_tag, entry_tag.c.entry_id == Entry.id)
+            .where(condition)
+            .group_by(Entry.user_id, entry_tag.c.tag_id, ENTRY_YEAR),
+        )
+    )
+
+
+def get_tag_stats(user_id: int) -> list[dict]:
+    # One dict per tag with weeks in total and by year, read off the summary
+    # table alone, so the cost does not grow with the number of entries
+    tags = {}
+    for tag_id, name, color, year, weeks in db.session.execute(
+        select(Tag.id, Tag.name, Tag.color, TagStat.year, TagStat.weeks)
+        .join(TagStat, TagStat.tag_id == Tag.id)
+        .where(TagStat.user_id == user_id)
+        .order_by(Tag.name, TagStat.year)
+    ):
+        tag = tags.setdefault(
+            tag_id,
+            {"id": tag_id, "name": name, "color": color, "weeks": 0, "years": {}},
+        )
+        tag["weeks"] += weeks
+        tag["years"][year] = weeks
+    return list(tags.values())
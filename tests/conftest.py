@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+from typing import Iterator
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# Any request issuing more statements than this fails with TooManyQueries
+SQL_QUERY_LIMIT = 50
+
+
+@pytest.fixture
+def database_path(tmp_path, monkeypatch):
+    # A path for a fresh SQLite database, its own cache directory, and dummy
+    # secrets, as create_app() reads them from the environment on Fly
+    monkeypatch.setenv("LIFECAL_ENV", "FLY")
+    for name in (
+        "FLASK_SECRET_KEY",
+        "GITHUB_CLIENT_ID",
+        "GITHUB_CLIENT_SECRET",
+        "GOOGLE_CLIENT_ID",
+        "GOOGLE_CLIENT_SECRET",
+    ):
+        monkeypatch.setenv(name, "test")
+    path = tmp_path / "test.db"
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("INIT_DB", raising=False)
+    return path
+
+
+@pytest.fixture
+def sqlite_foreign_keys():
+    # Enforces foreign keys on new SQLite connections, as Postgres does; put
+    # it before app in a test's arguments
+    def enable(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+    event.listen(Pool, "connect", enable)
+    yield
+    event.remove(Pool, "connect", enable)
+
+
+@pytest.fixture
+def app(database_path, monkeypatch):
+    # With the schema and the test user of init_db()
+    monkeypatch.setenv("INIT_DB", "1")
+    from app import create_app
+
+    return create_app({"TESTING": True, "SQL_QUERY_LIMIT": SQL_QUERY_LIMIT})
+
+
+@pytest.fixture
+def client(app):
+    # Signed in as the test user
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+        session["_fresh"] = True
+    return client
+
+
+@contextmanager
+def count_queries() -> Iterator[list[str]]:
+    # SQL statements run in the block, including those run while a streamed
+    # response body is read
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
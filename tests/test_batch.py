@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from models import db, Entry
+
+
+def entries(app) -> dict[str, tuple[str, list[str]]]:
+    # Note and tag names of each entry of the test user, by start
+    with app.app_context():
+        return {
+            e.start.isoformat(): (e.note, sorted(t.name for t in e.tags))
+            for e in db.session.execute(
+                select(Entry).options(selectinload(Entry.tags)).order_by(Entry.start)
+            ).scalars()
+        }
+
+
+def batch(client, **data):
+    return client.post("/entry/batch", data=data, follow_redirects=True)
+
+
+def test_batch_counts_created_and_updated(app, client):
+    # Two of the four weeks have entries of the test data
+    response = batch(
+        client, **{"tags[]": ["Tag 1"]}, start="2023-08-28", end="2023-09-20"
+    )
+    assert b"Created 2 and updated 2 entries from 2023-08-28 to 2023-09-18!" in (
+        response.data
+    )
+    assert list(entries(app)) == [
+        "2023-08-28",
+        "2023-09-04",
+        "2023-09-11",
+        "2023-09-18",
+    ]
+
+
+@pytest.mark.parametrize(
+    "note, replace, expected",
+    [
+        ("", "", ("Content of entry with tag 1", ["Tag 1", "Trip"])),
+        ("Away", "", ("Away", ["Tag 1", "Trip"])),
+        ("", "1", ("", ["Trip"])),
+        ("Away", "1", ("Away", ["Trip"])),
+    ],
+)
+def test_batch_merges_or_replaces(app, client, note, replace, expected):
+    data = {"tags[]": ["Trip"], "weeks": "2023-09-04, 2023-10-02", "note": note}
+    response = batch(client, **data, replace=replace)
+    assert b"Created 1 and updated 1 entries" in response.data
+    assert b"Added tags Trip!" in response.data
+    result = entries(app)
+    assert result["2023-09-04"] == expected
+    assert result["2023-10-02"] == (note, ["Trip"])
+
+
+def test_batch_rejects_blank_tag_names(app, client):
+    before = entries(app)
+    response = batch(client, **{"tags[]": [""]}, start="2023-10-02", end="2023-10-09")
+    assert response.status_code == 200
+    assert b"At least one tag must be selected!" in response.data
+    assert entries(app) == before
+
+
+@pytest.mark.parametrize(
+    "weeks",
+    [
+        {"start": "2023-10-02T00:00", "end": "2023-10-09T12:30"},
+        {"weeks": "2023-10-02T00:00,2023-10-09"},
+    ],
+)
+def test_batch_accepts_datetime_strings(app, client, weeks):
+    response = batch(client, **{"tags[]": ["Tag 1"]}, **weeks)
+    assert b"Created 2 and updated 0 entries" in response.data
+    assert list(entries(app))[-2:] == ["2023-10-02", "2023-10-09"]
+
+
+def test_batch_refuses_range_over_limit(app, client):
+    before = entries(app)
+    response = batch(
+        client, **{"tags[]": ["Tag 1"]}, start="0001-01-01", end="9999-12-31"
+    )
+    assert b"weeks can be edited at once!" in response.data
+    assert entries(app) == before
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Changes the test user's settings from a second app instance in another
+# process, on the same database, as a second gunicorn worker would
+WRITE_SETTINGS = """
+from app import create_app
+
+client = create_app({"TESTING": True}).test_client()
+with client.session_transaction() as session:
+    session["_user_id"] = "1"
+    session["_fresh"] = True
+response = client.post("/settings", data={"birth": "1990-01-01", "exp_years": "80"})
+assert response.status_code == 302, response.status_code
+"""
+
+
+def test_write_from_another_process_is_seen(app, client):
+    response = client.get("/api/grid")
+    assert response.json["birth"] == "1995-03-06"
+    env = dict(os.environ)
+    env.pop("INIT_DB")
+    subprocess.run(
+        [sys.executable, "-c", WRITE_SETTINGS],
+        cwd=Path(__file__).parents[1],
+        env=env,
+        check=True,
+    )
+    response = client.get(
+        "/api/grid", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert response.status_code == 200
+    assert response.json["birth"] == "1990-01-01"
@@ -0,0 +1,103 @@
+import pytest
+
+
+def changes(client, since=None, limit=None) -> dict:
+    params = {}
+    if since is not None:
+        params["since"] = since
+    if limit is not None:
+        params["limit"] = limit
+    response = client.get("/api/changes", query_string=params)
+    assert response.status_code == 200
+    return response.json
+
+
+def add_entry(client, start: str, tags: list[str] = ["Tag 1"]):
+    response = client.post(
+        "/entry/add", data={"start": start, "tags[]": tags, "note": ""}
+    )
+    assert response.status_code == 302
+
+
+def entry_ids(page: dict) -> list[int]:
+    return [e["id"] for e in page["entries"]]
+
+
+@pytest.fixture
+def since(client) -> int:
+    # The cursor of a client in sync. The first write also stamps the rows of
+    # the test data, which are created without a revision.
+    add_entry(client, "2023-08-28")
+    return changes(client)["cursor"]
+
+
+def test_full_state(client):
+    page = changes(client)
+    assert entry_ids(page) == [1, 2]
+    assert [t["id"] for t in page["tags"]] == [1, 2]
+    assert page["settings"] == {"birth": "1995-03-06", "exp_years": 80}
+    assert page["more"] is False
+    assert changes(client, since=page["cursor"])["entries"] == []
+
+
+def test_pages_end_at_revision_boundaries(client, since):
+    # One revision of three entries, then two of one entry each
+    response = client.post(
+        "/entry/batch",
+        data={"tags[]": ["Tag 1"], "start": "2024-01-01", "end": "2024-01-15"},
+    )
+    assert response.status_code == 302
+    add_entry(client, "2024-02-05")
+    add_entry(client, "2024-02-12")
+    # A revision larger than the limit still comes whole
+    page = changes(client, since=since, limit=2)
+    assert [e["start"] for e in page["entries"]] == [
+        "2024-01-01",
+        "2024-01-08",
+        "2024-01-15",
+    ]
+    assert page["more"] is True
+    page = changes(client, since=page["cursor"], limit=1)
+    assert [e["start"] for e in page["entries"]] == ["2024-02-05"]
+    assert page["more"] is True
+    page = changes(client, since=page["cursor"], limit=2)
+    assert [e["start"] for e in page["entries"]] == ["2024-02-12"]
+    assert page["more"] is False
+    assert page["cursor"] == changes(client)["cursor"]
+    assert changes(client, since=page["cursor"])["entries"] == []
+
+
+def test_tombstones_for_deleted_entries_and_tags(client, since):
+    assert client.post("/entry/1/delete").status_code == 302
+    assert client.post("/tag/2/delete").status_code == 302
+    page = changes(client, since=since)
+    assert page["deleted"] == {"entries": [1], "tags": [2]}
+    # Entry 2 lost tag 2
+    assert [(e["id"], e["tags"]) for e in page["entries"]] == [(2, [1])]
+
+
+def test_tombstone_suppressed_when_id_is_reused(client, since):
+    assert client.post("/entry/3/delete").status_code == 302
+    middle = changes(client, since=since)
+    assert middle["deleted"]["entries"] == [3]
+    # SQLite gives the highest id again to the next row
+    add_entry(client, "2024-03-04")
+    page = changes(client, since=since)
+    assert entry_ids(page) == [3]
+    assert page["entries"][0]["start"] == "2024-03-04"
+    assert page["deleted"]["entries"] == []
+    # A client that saw the deletion gets the new entry under the same id
+    page = changes(client, since=middle["cursor"])
+    assert entry_ids(page) == [3]
+    assert page["deleted"]["entries"] == []
+
+
+def test_settings_only_after_settings_change(client, since):
+    add_entry(client, "2024-01-01")
+    page = changes(client, since=since)
+    assert page["settings"] is None
+    response = client.post("/settings", data={"birth": "1990-01-01", "exp_years": "90"})
+    assert response.status_code == 302
+    page = changes(client, since=since)
+    assert page["settings"] == {"birth": "1990-01-01", "exp_years": 90}
+    assert changes(client, since=page["cursor"])["settings"] is None
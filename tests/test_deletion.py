@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import func, select, text
+
+from deletion import pending_deletions, purge_user
+from jobs import enqueue, run_jobs
+from models import db, Entry, Job, Tag, TagStat, Tombstone, User
+
+
+def user_rows(app) -> dict[str, int]:
+    # Rows left of the test user, the only one in the database, in each table
+    # that holds their data; jobs not owned by a user, like purges, are kept
+    with app.app_context():
+        counts = {
+            model.__tablename__: db.session.execute(
+                select(func.count()).select_from(model)
+            ).scalar_one()
+            for model in (User, Entry, Tag, TagStat, Tombstone)
+        }
+        for name in ("entry_tag", "entry_search"):
+            counts[name] = db.session.execute(
+                text(f"SELECT COUNT(*) FROM {name}")
+            ).scalar_one()
+        counts["jobs"] = db.session.execute(
+            select(func.count()).select_from(Job).where(Job.user_id == 1)
+        ).scalar_one()
+        return counts
+
+
+@pytest.fixture
+def account(app, client):
+    # The test user with six entries, a tombstone and a job of their own
+    response = client.post(
+        "/entry/batch",
+        data={"tags[]": ["Tag 2"], "start": "2024-01-01", "end": "2024-01-29"},
+    )
+    assert response.status_code == 302
+    client.post("/entry/1/delete")
+    with app.app_context():
+        enqueue("noop", {}, user_id=1)
+        db.session.commit()
+    assert all(user_rows(app).values())
+    return client
+
+
+def test_delete_small_account(app, account):
+    response = account.post("/user/1/delete")
+    assert response.status_code == 302
+    assert not any(user_rows(app).values())
+
+
+@pytest.mark.parametrize("chunk", [None, 2])
+def test_delete_large_account(app, account, monkeypatch, chunk):
+    monkeypatch.setattr("deletion.SYNC_DELETE_MAX_ENTRIES", 3)
+    response = account.post("/user/1/delete", follow_redirects=True)
+    assert b"removed in the background" in response.data
+    with app.app_context():
+        assert pending_deletions() == [1]
+        assert db.session.get(User, 1).oauth_id == "deleted:1"
+        if chunk is None:  # By the queued job, after the user's own one
+            assert run_jobs(once=True) == 2
+        else:
+            purge_user(1, chunk=chunk)
+        assert pending_deletions() == []
+    assert not any(user_rows(app).values())
+
+
+def test_purge_leaves_unmarked_user(app, account):
+    before = user_rows(app)
+    with app.app_context():
+        purge_user(1)
+    assert user_rows(app) == before
@@ -0,0 +1,66 @@
+import datetime
+import tracemalloc
+
+import pytest
+from sqlalchemy import delete, insert, update
+
+from cache import NullCache, user_cache
+from grid import grid_start
+from models import db, entry_tag, Entry, User
+from occupancy import rebuild_occupancy
+
+SCRIPT_TAG_NAME = "</script><img src=x onerror=alert(1)>"
+
+
+@pytest.mark.parametrize("zoom", ["month", "year", "decade"])
+def test_zoom_payload_escapes_tag_names(client, zoom):
+    client.post("/tag/1/edit", data={"name": SCRIPT_TAG_NAME, "color": "red"})
+    page = client.get(f"/?zoom={zoom}").get_data(as_text=True)
+    assert SCRIPT_TAG_NAME not in page
+    assert "\\u003c/script\\u003e\\u003cimg" in page
+    payload = client.get(f"/api/grid?zoom={zoom}").json
+    assert [SCRIPT_TAG_NAME, "red"] in payload["tags"].values()
+
+
+# Most Python memory one grid request may allocate at its peak, body
+# included, for a 120 year grid with an entry in every past week and the
+# grid cache off. Loading those entries as ORM objects takes about 7 MiB.
+GRID_REQUEST_BUDGET_KIB = 640
+
+
+def fill_grid(app):
+    birth = datetime.date.today() - datetime.timedelta(days=100 * 365)
+    start = grid_start(birth)
+    with app.app_context():
+        db.session.execute(
+            update(User).where(User.id == 1).values(birth=birth, exp_years=120)
+        )
+        db.session.execute(delete(entry_tag))
+        db.session.execute(delete(Entry))
+        db.session.execute(
+            insert(Entry),
+            [
+                {"user_id": 1, "start": start + datetime.timedelta(weeks=w)}
+                for w in range((datetime.date.today() - start).days // 7)
+            ],
+        )
+        rebuild_occupancy(db.session, 1)
+        db.session.commit()
+
+
+@pytest.mark.parametrize("path", ["/", "/api/grid"])
+def test_grid_request_memory_budget(app, client, monkeypatch, path):
+    fill_grid(app)
+    monkeypatch.setattr(user_cache, "backend", NullCache())
+    client.get(path).get_data()  # Imports and caches outside the grid
+    tracemalloc.start()
+    try:
+        response = client.get(path)
+        size = len(response.get_data())
+        response.close()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert response.status_code == 200
+    assert size > 20_000  # The whole grid, not just the page header
+    assert peak / 1024 <= GRID_REQUEST_BUDGET_KIB
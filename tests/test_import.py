@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from models import db, Entry, Job
+
+MALFORMED_ROWS = [
+    {"start": 20240101, "tags": ["Tag 1"]},
+    {"start": ["2024-01-01"], "tags": ["Tag 1"]},
+    {"start": "2024-01-01", "tags": [""]},
+    {"start": "2024-01-01", "tags": [1]},
+    {"start": "2024-01-01", "tags": {"Tag 1": True}},
+    {"start": "2024-01-01", "tags": ["Tag 1"], "note": {"text": "x"}},
+    {"start": "2024-01-01", "tags": ["Tag 1"], "note": ["x"]},
+    {"start": "2024-01-01", "tags": ["Tag 1"], "note": "a\x00b"},
+]
+
+
+def upload(client, content: bytes, filename: str = "lifecal.ndjson"):
+    return client.post(
+        "/import",
+        data={"file": (io.BytesIO(content), filename)},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+
+
+def entry_starts(app) -> list[str]:
+    with app.app_context():
+        return [
+            d.isoformat()
+            for d in db.session.execute(
+                select(Entry.start).where(Entry.user_id == 1).order_by(Entry.start)
+            ).scalars()
+        ]
+
+
+@pytest.mark.parametrize("row", MALFORMED_ROWS)
+def test_import_skips_malformed_row(app, client, row):
+    good = {"start": "2024-01-08", "tags": ["Tag 1"], "note": "Fine"}
+    content = "\n".join(json.dumps(r) for r in (row, good)).encode()
+    response = upload(client, content)
+    assert response.status_code == 200
+    assert b"1 skipped" in response.data
+    assert entry_starts(app) == ["2023-09-04", "2023-09-11", "2024-01-08"]
+
+
+def test_import_rejects_non_utf8(app, client):
+    response = upload(client, b"start,note,tags\n2024-01-08,caf\xe9,Tag 1\n", "a.csv")
+    assert response.status_code == 200
+    assert b"must be UTF-8" in response.data
+    assert entry_starts(app) == ["2023-09-04", "2023-09-11"]
+
+
+def job_count(app) -> int:
+    with app.app_context():
+        return db.session.execute(select(func.count()).select_from(Job)).scalar()
+
+
+def test_import_refuses_file_over_limit(app, client, monkeypatch):
+    monkeypatch.setattr("app.IMPORT_INLINE_MAX_BYTES", 100)
+    monkeypatch.setattr("app.IMPORT_MAX_BYTES", 1000)
+    row = json.dumps({"start": "2024-01-08", "tags": ["Tag 1"], "note": "x" * 50})
+    response = upload(client, "\n".join([row] * 20).encode())
+    assert b"may be at most" in response.data
+    assert job_count(app) == 0
+    response = upload(client, "\n".join([row] * 5).encode())
+    assert b"imported in the background" in response.data
+    assert job_count(app) == 1
+
+
+def test_import_refuses_body_over_max_content_length(app, client):
+    app.config["MAX_CONTENT_LENGTH"] = 1000
+    response = upload(client, b"x" * 2000)
+    assert b"may be at most" in response.data
+    assert job_count(app) == 0
@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+from sqlalchemy import func, select, update
+
+from jobs import JOB_HANDLERS, JOB_RETRY_DELAY, claim_job, enqueue, run_jobs, utcnow
+from models import db, Job
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    calls = []
+
+    def fail(**payload):
+        calls.append(payload)
+        raise ValueError("Broken")
+
+    def succeed(**payload):
+        calls.append(payload)
+        return {"ok": True}
+
+    monkeypatch.setitem(JOB_HANDLERS, "fail", fail)
+    monkeypatch.setitem(JOB_HANDLERS, "succeed", succeed)
+    return calls
+
+
+def naive_utc(value: datetime.datetime) -> datetime.datetime:
+    # SQLite returns UTC timestamps without their time zone
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def make_due(job_id: int):
+    db.session.execute(update(Job).where(Job.id == job_id).values(run_after=utcnow()))
+    db.session.commit()
+
+
+def test_failing_job_is_retried_with_backoff(app, handlers):
+    with app.app_context():
+        job_id = enqueue("fail", {"n": 1}, max_attempts=3)
+        db.session.commit()
+        for attempt in (1, 2):
+            started = naive_utc(utcnow())
+            assert run_jobs(once=True) == 1
+            job = db.session.get(Job, job_id)
+            assert (job.status, job.attempts, job.error) == (
+                "queued",
+                attempt,
+                "Broken",
+            )
+            delay = JOB_RETRY_DELAY * 2 ** (attempt - 1)
+            assert (
+                started + delay
+                <= naive_utc(job.run_after)
+                <= naive_utc(utcnow() + delay)
+            )
+            # Not due again before its delay
+            assert run_jobs(once=True) == 0
+            db.session.remove()
+            make_due(job_id)
+        assert run_jobs(once=True) == 1
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts, job.payload) == ("failed", 3, None)
+        assert run_jobs(once=True) == 0
+    assert handlers == [{"n": 1}] * 3
+
+
+def test_expired_lease_is_reclaimed(app, handlers):
+    with app.app_context():
+        job_id = enqueue("succeed", {})
+        db.session.commit()
+        assert claim_job().id == job_id  # By a worker that then dies
+        assert run_jobs(once=True) == 0
+        db.session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(locked_until=utcnow() - datetime.timedelta(seconds=1))
+        )
+        db.session.commit()
+        assert run_jobs(once=True) == 1
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts, job.result) == ("done", 2, {"ok": True})
+    assert handlers == [{}]
+
+
+def test_idempotency_key_returns_same_job(app):
+    with app.app_context():
+        job_id = enqueue("succeed", {"n": 1}, user_id=1, key="import:1:abc")
+        db.session.commit()
+        assert enqueue("succeed", {"n": 2}, user_id=1, key="import:1:abc") == job_id
+        db.session.commit()
+        assert db.session.execute(select(func.count()).select_from(Job)).scalar() == 1
+        assert db.session.get(Job, job_id).payload == {"n": 1}
@@ -0,0 +1,37 @@
+import re
+
+# Metrics are kept per process, across the apps of other tests, so tests
+# compare them before and after a request
+
+
+def metric(client, name: str, route: str) -> float:
+    text = client.get("/metrics").get_data(as_text=True)
+    match = re.search(rf'^{name}{{method="GET",route="{route}"}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_streamed_route_counts_its_whole_body(client):
+    # GET / streams the grid, whose statements run after the headers are sent
+    statements = metric(client, "lifecal_sql_statements_total", "main.index")
+    count = metric(client, "lifecal_request_duration_seconds_count", "main.index")
+    response = client.get("/")
+    assert 'desc="1 queries"' in response.headers["Server-Timing"]
+    assert metric(client, "lifecal_sql_statements_total", "main.index") == statements
+    response.get_data()
+    response.close()
+    assert (
+        metric(client, "lifecal_sql_statements_total", "main.index") == statements + 3
+    )
+    assert (
+        metric(client, "lifecal_request_duration_seconds_count", "main.index")
+        == count + 1
+    )
+
+
+def test_buffered_route_is_recorded_at_once(client):
+    statements = metric(client, "lifecal_sql_statements_total", "main.api_grid")
+    client.get("/api/grid")
+    assert (
+        metric(client, "lifecal_sql_statements_total", "main.api_grid")
+        == statements + 3
+    )
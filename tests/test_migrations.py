@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import select
+
+from migrations import LATEST_VERSION, get_schema_version, upgrade_db
+from models import db, entry_tag, Entry, Tag
+
+# The schema before migrations, with no unique indexes
+OLD_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    oauth_id VARCHAR(100) NOT NULL, birth DATE NOT NULL, exp_years INTEGER NOT NULL,
+    email VARCHAR(100));
+CREATE TABLE tags (
+    id INTEGER PRIMARY KEY, created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    user_id INTEGER NOT NULL REFERENCES users (id), name VARCHAR NOT NULL,
+    color VARCHAR NOT NULL, type VARCHAR(5), category INTEGER);
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY, created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    user_id INTEGER NOT NULL REFERENCES users (id), start DATE NOT NULL, note VARCHAR);
+CREATE TABLE entry_tag (
+    entry_id INTEGER NOT NULL REFERENCES entries (id),
+    tag_id INTEGER NOT NULL REFERENCES tags (id),
+    PRIMARY KEY (entry_id, tag_id));
+INSERT INTO users (id, oauth_id, birth, exp_years) VALUES (1, 'gh_1', '1990-01-01', 80);
+INSERT INTO tags (id, user_id, name, color) VALUES
+    (1, 1, 'Work', 'red'), (2, 1, 'Work', 'blue'), (3, 1, 'Trip', 'green');
+INSERT INTO entries (id, user_id, start, note) VALUES
+    (1, 1, '2020-01-06', 'First'), (2, 1, '2020-01-06', 'Second'),
+    (3, 1, '2020-01-06', NULL), (4, 1, '2020-01-13', 'Other week');
+INSERT INTO entry_tag (entry_id, tag_id) VALUES
+    (1, 1), (2, 2), (2, 3), (3, 1), (3, 2), (4, 2);
+"""
+
+
+def create_old_database(path, script: str = OLD_SCHEMA):
+    conn = sqlite3.connect(path)
+    conn.executescript(script)
+    conn.close()
+
+
+def test_upgrade_merges_duplicates(database_path):
+    create_old_database(database_path)
+    from app import create_app
+
+    app = create_app({"TESTING": True})
+    upgrade_db(app)
+    with app.app_context():
+        assert get_schema_version() == LATEST_VERSION
+        assert db.session.execute(select(Tag.id, Tag.name).order_by(Tag.id)).all() == [
+            (1, "Work"),
+            (3, "Trip"),
+        ]
+        assert db.session.execute(
+            select(Entry.id, Entry.note).order_by(Entry.id)
+        ).all() == [
+            (1, "First\n\nSecond"),
+            (4, "Other week"),
+        ]
+        assert sorted(db.session.execute(select(entry_tag)).all()) == [
+            (1, 1),
+            (1, 3),
+            (4, 1),
+        ]
+
+
+def test_upgrade_reports_shared_oauth_ids(database_path):
+    create_old_database(
+        database_path,
+        OLD_SCHEMA + "INSERT INTO users (oauth_id, birth, exp_years)"
+        " VALUES ('gh_1', '1990-01-01', 80);",
+    )
+    from app import create_app
+
+    app = create_app({"TESTING": True})
+    with pytest.raises(RuntimeError, match="gh_1"):
+        upgrade_db(app)
@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from conftest import count_queries
+from models import db, entry_tag, Entry
+from querycount import TooManyQueries
+from occupancy import rebuild_occupancy
+from search import rebuild_search_index
+from stats import rebuild_tag_stats
+
+# Statements per request, signed in with nothing cached. They must not grow
+# with the number of entries, so each route is checked with the two entries
+# of the test user and again with a few hundred more.
+EXPECTED_QUERIES = [
+    ("GET", "/", None, 3),
+    ("GET", "/api/grid", None, 3),
+    ("GET", "/tags", None, 2),
+    ("GET", "/entry/1/edit", None, 5),
+    (
+        "POST",
+        "/entry/1/edit",
+        {"start": "2023-09-18", "tags[]": ["Tag 1", "Tag 3"], "note": "Moved"},
+        19,
+    ),
+    (
+        "POST",
+        "/entry/add",
+        {"start": "2023-09-25", "tags[]": ["Tag 1"], "note": "Added"},
+        16,
+    ),
+]
+
+
+def add_entries(app, n_entries: int):
+    # Weekly entries from 2000 on, each with both tags of the test user
+    if not n_entries:
+        return
+    start = datetime.date(2000, 1, 3)
+    with app.app_context():
+        entry_ids = (
+            db.session.execute(
+                insert(Entry).returning(Entry.id),
+                [
+                    {
+                        "user_id": 1,
+                        "start": start + datetime.timedelta(weeks=i),
+                        "note": f"Week {i}",
+                    }
+                    for i in range(n_entries)
+                ],
+            )
+            .scalars()
+            .all()
+        )
+        db.session.execute(
+            insert(entry_tag),
+            [{"entry_id": e, "tag_id": t} for e in entry_ids for t in (1, 2)],
+        )
+        rebuild_tag_stats(db.session, 1)
+        rebuild_search_index(db.session, 1)
+        rebuild_occupancy(db.session, 1)
+        db.session.commit()
+
+
+@pytest.mark.parametrize("n_entries", [0, 300])
+@pytest.mark.parametrize("method,path,data,expected", EXPECTED_QUERIES)
+def test_query_count(app, client, n_entries, method, path, data, expected):
+    add_entries(app, n_entries)
+    with count_queries() as statements:
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+    assert response.status_code in (200, 302)
+    assert len(statements) == expected, "\n".join(statements)
+
+
+def test_query_count_cached(client):
+    # A repeated GET of the grid is answered from the cache
+    client.get("/").get_data()
+    with count_queries() as statements:
+        for path in ("/", "/api/grid"):
+            assert client.get(path).status_code == 200
+    assert statements == []
+
+
+def test_query_limit(app, client):
+    app.config["SQL_QUERY_LIMIT"] = 2
+    with pytest.raises(TooManyQueries):
+        client.get("/entry/1/edit")
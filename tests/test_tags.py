@@ -0,0 +1,62 @@
+from datetime import date
+
+from sqlalchemy import select
+
+from grid import grid_start
+from models import db, Entry, Tag, TagStat
+from occupancy import build_bitmap, get_occupancy
+
+
+def tag_stats(app) -> list[tuple[int, int, int]]:
+    with app.app_context():
+        return db.session.execute(
+            select(TagStat.tag_id, TagStat.year, TagStat.weeks).order_by(
+                TagStat.tag_id, TagStat.year
+            )
+        ).all()
+
+
+def test_delete_tag_in_use(sqlite_foreign_keys, app, client):
+    assert tag_stats(app) == [(1, 2023, 2), (2, 2023, 1)]
+    response = client.post("/tag/1/delete")
+    assert response.status_code == 302
+    assert tag_stats(app) == [(2, 2023, 1)]
+
+
+def test_merge_tag_in_use(sqlite_foreign_keys, app, client):
+    response = client.post("/tag/1/merge", data={"into": 2})
+    assert response.status_code == 302
+    assert tag_stats(app) == [(2, 2023, 2)]
+
+
+def test_delete_tag_keeps_weeks_occupied(app, client):
+    client.post("/tag/1/delete")
+    with app.app_context():
+        bitmap = get_occupancy(1)
+        starts = db.session.execute(select(Entry.start)).scalars().all()
+        assert bitmap == build_bitmap(grid_start(date(1995, 3, 6)), starts)
+    # Moving an entry onto a week still taken is refused rather than failing
+    response = client.post(
+        "/entry/2/edit",
+        data={"start": "2023-09-04", "tags[]": ["Tag 2"], "note": ""},
+    )
+    assert response.status_code == 302
+    assert response.location.endswith("/entry/2/edit")
+
+
+def test_new_tag_not_announced_for_invalid_entry(app, client):
+    for path, start in (("/entry/add", "2023-09-05"), ("/entry/2/edit", "2023-09-04")):
+        response = client.post(
+            path,
+            data={"start": start, "tags[]": ["New tag"], "note": ""},
+            follow_redirects=True,
+        )
+        assert b"Added tags" not in response.data
+    with app.app_context():
+        assert db.session.execute(select(Tag).where(Tag.name == "New tag")).all() == []
+    response = client.post(
+        "/entry/add",
+        data={"start": "2024-01-08", "tags[]": ["New tag"], "note": ""},
+        follow_redirects=True,
+    )
+    assert b"Added tags New tag!" in response.data
@@ -0,0 +1,48 @@
+from sqlalchemy import select
+
+from models import db, TagStat
+from occupancy import get_occupancy, rebuild_occupancy
+from search import rebuild_search_index, search_entries
+from stats import rebuild_tag_stats
+
+WRITES = [
+    ("/entry/1/edit", {"start": "2023-09-18", "tags[]": ["Tag 2", "Trip"], "note": ""}),
+    ("/entry/add", {"start": "2023-10-02", "tags[]": ["Tag 1"], "note": "Hike"}),
+    ("/entry/add", {"start": "2023-10-02", "tags[]": ["Trip"], "note": "Walk"}),
+    ("/entry/batch", {"tags[]": ["Tag 1"], "start": "2023-09-18", "end": "2023-10-09"}),
+    ("/entry/2/delete", {}),
+    ("/tag/1/merge", {"into": 2}),
+    ("/tag/2/delete", {}),
+]
+
+
+def derived_data(app) -> tuple:
+    # What entries_changed() maintains, other than the changes feed
+    with app.app_context():
+        stats = db.session.execute(
+            select(TagStat.tag_id, TagStat.year, TagStat.weeks).order_by(
+                TagStat.tag_id, TagStat.year
+            )
+        ).all()
+        found = {
+            term: sorted(r["id"] for r in search_entries(1, term)[0])
+            for term in ("tag", "trip", "hike", "walk")
+        }
+        return stats, get_occupancy(1), found
+
+
+def test_writes_match_rebuilt_data(app, client):
+    snapshots = []
+    for path, data in WRITES:
+        response = client.post(path, data=data)
+        assert response.status_code == 302
+        snapshot = derived_data(app)
+        with app.app_context():
+            rebuild_tag_stats(db.session, 1)
+            rebuild_occupancy(db.session, 1)
+            rebuild_search_index(db.session, 1)
+            db.session.commit()
+        assert snapshot == derived_data(app), path
+        snapshots.append(snapshot)
+    # The writes did change the data, so the comparisons were not vacuous
+    assert len({repr(s) for s in snapshots}) == len(WRITES)
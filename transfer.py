@@ -0,0 +1,231 @@
+import csv
+import datetime
+import io
+import json
+import time
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import delete, insert, select
+
+from cache import user_cache
+from jobs import job_handler
+from models import db, entry_tag, get_or_create_tags, upsert, Entry, Tag, User
+from validation import date_error
+from writes import entries_changed
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_FIELDS = ["start", "note", "tags"]
+CSV_TAG_SEPARATOR = ";"
+IMPORT_BATCH_SIZE = 1000
+# Larger uploads are imported by a job rather than during the request
+IMPORT_INLINE_MAX_BYTES = 256 * 1024
+# Larger uploads are refused, as the job holds the whole file in its payload
+IMPORT_MAX_BYTES = 8 * 1024 * 1024
+IMPORT_JOB_MAX_ERRORS = 100
+EXPORT_YIELD_PER = 1000
+
+
+def iter_user_entries(user_id: int) -> Iterator[dict]:
+    # One row per (entry, tag) ordered by entry, streamed from a server-side
+    # cursor and grouped back into entries as they arrive
+    rows = db.session.execute(
+        select(Entry.id, Entry.start, Entry.note, Tag.name)
+        .outerjoin(entry_tag, entry_tag.c.entry_id == Entry.id)
+        .outerjoin(Tag, Tag.id == entry_tag.c.tag_id)
+        .where(Entry.user_id == user_id)
+        .order_by(Entry.start, Entry.id, Tag.name)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    current = None
+    current_id = None
+    for entry_id, start, note, tag_name in rows:
+        if entry_id != current_id:
+            if current is not None:
+                yield current
+            current = {"start": start.isoformat(), "note": note or "", "tags": []}
+            current_id = entry_id
+        if tag_name is not None:
+            current["tags"].append(tag_name)
+    if current is not None:
+        yield current
+
+
+def export_ndjson(user_id: int) -> Iterator[str]:
+    for entry in iter_user_entries(user_id):
+        yield json.dumps(entry) + "\n"
+
+
+def export_csv(user_id: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for entry in iter_user_entries(user_id):
+        writer.writerow({**entry, "tags": CSV_TAG_SEPARATOR.join(entry["tags"])})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else {}
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[dict]:
+    for row in csv.DictReader(lines):
+        tags = row.get("tags") or ""
+        yield {**row, "tags": [t for t in tags.split(CSV_TAG_SEPARATOR) if t]}
+
+
+def parse_rows(lines: Iterable[str], fmt: str) -> Iterator[dict]:
+    return parse_csv(lines) if fmt == "csv" else parse_ndjson(lines)
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows(self) -> int:
+        return self.created + self.updated
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"Imported {self.rows} entries ({self.created} created, {self.updated}"
+            f" updated, {len(self.errors)} skipped) in {self.seconds:.2f}s"
+            f" ({self.rows_per_second:.0f} rows/s)"
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "skipped": len(self.errors),
+            "errors": self.errors[:IMPORT_JOB_MAX_ERRORS],
+            "seconds": round(self.seconds, 3),
+            "message": str(self),
+        }
+
+
+def is_text(value) -> bool:
+    # Postgres text cannot hold NUL characters
+    return isinstance(value, str) and "\x00" not in value
+
+
+def row_error(start, tags, note) -> Optional[str]:
+    # The rules of the entry form, plus the types a JSON row can get wrong
+    error = date_error(start, only_monday=True, name="Start date")
+    if error is not None:
+        return error
+    if not isinstance(tags, list) or not all(is_text(t) for t in tags):
+        return "Tags must be a list of tag names"
+    if not any(tags):
+        return "At least one tag must be selected!"
+    if note is not None and not is_text(note):
+        return "Note must be text"
+    return None
+
+
+def import_batch(user_id: int, batch: dict[str, dict], result: ImportResult):
+    tags_db, _ = get_or_create_tags(
+        user_id, [t for row in batch.values() for t in row["tags"]]
+    )
+    starts = [date.fromisoformat(s) for s in batch]
+    existing = set(
+        db.session.execute(
+            select(Entry.start).where(
+                (Entry.user_id == user_id) & (Entry.start.in_(starts))
+            )
+        ).scalars()
+    )
+    changed = Entry.start.in_(starts)
+    with entries_changed(user_id, changed):
+        # Create-or-update, one statement for the whole batch
+        statement = upsert(Entry).values(
+            [
+                {
+                    "user_id": user_id,
+                    "start": date.fromisoformat(start),
+                    "note": row["note"],
+                }
+                for start, row in batch.items()
+            ]
+        )
+        entry_ids = dict(
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["user_id", "start"],
+                    set_={"note": statement.excluded.note},
+                ).returning(Entry.start, Entry.id)
+            ).all()
+        )
+        db.session.execute(
+            delete(entry_tag).where(entry_tag.c.entry_id.in_(list(entry_ids.values())))
+        )
+        links = [
+            {"entry_id": entry_ids[date.fromisoformat(start)], "tag_id": tags_db[t].id}
+            for start, row in batch.items()
+            for t in dict.fromkeys(row["tags"])
+        ]
+        if links:
+            db.session.execute(insert(entry_tag), links)
+    db.session.commit()
+    result.updated += len(existing)
+    result.created += len(batch) - len(existing)
+
+
+def import_entries(
+    user_id: int, rows: Iterable[dict], batch_size: int = IMPORT_BATCH_SIZE
+) -> ImportResult:
+    # Validates rows with the same rules as the entry form and writes them in
+    # batches, each in its own transaction
+    result = ImportResult()
+    started = time.perf_counter()
+    batch = {}
+    for line, row in enumerate(rows, start=1):
+        start, tags, note = row.get("start"), row.get("tags") or [], row.get("note")
+        if isinstance(tags, str):
+            tags = [tags]
+        error = row_error(start, tags, note)
+        if error is not None:
+            result.errors.append(f"Row {line}: {error}")
+            continue
+        # Later rows for the same week win, as a batch may only touch a row once
+        batch[datetime.datetime.fromisoformat(start).date().isoformat()] = {
+            "note": note or "",
+            "tags": [t for t in tags if t],
+        }
+        if len(batch) >= batch_size:
+            import_batch(user_id, batch, result)
+            batch = {}
+    if batch:
+        import_batch(user_id, batch, result)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+@job_handler("import_entries")
+def import_entries_job(user_id: int, fmt: str, text: str) -> Optional[dict]:
+    # Rows are upserted by start, so importing again after a failure is safe
+    active = db.session.execute(
+        select(User.id).where((User.id == user_id) & User.deleted_at.is_(None))
+    ).first()
+    if active is None:
+        return None
+    result = import_entries(user_id, parse_rows(io.StringIO(text, newline=""), fmt))
+    user_cache.bump(user_id)
+    return result.as_dict()
@@ -0,0 +1,17 @@
+import datetime
+from typing import Optional
+
+
+def date_error(date: str, only_monday=False, name="Date") -> Optional[str]:
+    # Returns a user-facing message if date is invalid, otherwise None
+    if not date:
+        return f"{name} is required!"
+    if not isinstance(date, str):
+        return f"{name} is required to be in YYYY-MM-DD format"
+    try:
+        date = datetime.datetime.fromisoformat(date)
+    except ValueError:
+        return f"{name} is required to be in YYYY-MM-DD format"
+    if only_monday and date.weekday() != 0:
+        return f"{name} must be a Monday (start of week)"
+    return None
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from changes import entries_revised
+from models import db, entry_tag, Entry
+from occupancy import update_occupancy
+from search import reindex_entries
+from stats import apply_tag_deltas, count_tag_weeks
+
+
+def matching_rows(user_id: int, condition) -> list[tuple[int, date, Optional[int]]]:
+    # (entry id, start, tag id) of the user's entries matching condition, one
+    # row per tag, or one with no tag id for an entry without tags
+    return db.session.execute(
+        select(Entry.id, Entry.start, entry_tag.c.tag_id)
+        .select_from(Entry)
+        .outerjoin(entry_tag, entry_tag.c.entry_id == Entry.id)
+        .where((Entry.user_id == user_id) & condition)
+    ).all()
+
+
+@contextmanager
+def entries_changed(user_id: int, condition) -> Iterator[None]:
+    """Keeps the tag statistics, search index, occupancy bitmap and changes
+    feed in step with a write to the user's entries or entry tags.
+
+    condition must select every entry row the block changes, both before and
+    after the change (e.g. Entry.start.in_(old and new starts)), and may
+    refer to entry_tag. The matching rows are read once before the block and
+    once after, and each of the four is updated from the difference. Runs in
+    the caller's transaction, so the caller commits."""
+    before = matching_rows(user_id, condition)
+    yield
+    db.session.flush()
+    after = matching_rows(user_id, condition)
+    deltas = count_tag_weeks(after)
+    deltas.subtract(count_tag_weeks(before))
+    apply_tag_deltas(user_id, deltas)
+    starts_before = {entry_id: start for entry_id, start, _ in before}
+    starts_after = {entry_id: start for entry_id, start, _ in after}
+    # An entry can stop matching and still exist, e.g. once the tag in
+    # condition is deleted, so the starts of those are read by id
+    unmatched = starts_before.keys() - starts_after.keys()
+    if unmatched:
+        starts_after.update(
+            db.session.execute(
+                select(Entry.id, Entry.start).where(Entry.id.in_(unmatched))
+            ).all()
+        )
+    changed = starts_before.keys() | starts_after.keys()
+    reindex_entries(db.session, sorted(changed))
+    update_occupancy(user_id, set(starts_before.values()), set(starts_after.values()))
+    entries_revised(user_id, starts_after.keys(), changed - starts_after.keys())